@@ -5,18 +5,26 @@ import threading
 from taskeduler.task import TaskManager
 from taskeduler.parser import TaskParser
 from pvpc_bot.bot.bot import ReeBot
-from pvpc_bot.config import TASKS_FILE, TASKS_PATH
+from pvpc_bot.bot.webhook import WebhookServer
+from pvpc_bot.bot.utils.metrics import start_metrics_server
+from pvpc_bot.config import TASKS_FILE, TASKS_PATH, BOT_UPDATES, METRICS_PORT
 
 
 def set_task_path():
     with open(TASKS_FILE, "rt") as f:
         tasks_dct = yaml.safe_load(f.read())
+        changed = False
         for task in tasks_dct:
             current_path = tasks_dct[task]["script"]["file"]
-            tasks_dct[task]["script"]["file"] = os.path.join(TASKS_PATH, os.path.basename(current_path))
-    
-    with open(TASKS_FILE, "wt") as f:
-        f.write(yaml.safe_dump(tasks_dct))
+            task_path = os.path.join(TASKS_PATH, os.path.basename(current_path))
+            if task_path != current_path:
+                tasks_dct[task]["script"]["file"] = task_path
+                changed = True
+
+    # Only rewritten when the bot was moved, not on every boot
+    if changed:
+        with open(TASKS_FILE, "wt") as f:
+            f.write(yaml.safe_dump(tasks_dct))
 
 if __name__ == "__main__":
     # Create the task manager loop
@@ -30,6 +38,12 @@ if __name__ == "__main__":
     task_thread.start()
 
     # Create the bot loop
-    ree_bot = ReeBot()
-    ree_bot.infinity_polling()
+    if METRICS_PORT:
+        start_metrics_server()
+    # Webhook updates are handled by the server workers, behind its bounded queue
+    ree_bot = ReeBot(threaded=BOT_UPDATES != "webhook")
+    if BOT_UPDATES == "webhook":
+        WebhookServer(ree_bot).serve_forever()
+    else:
+        ree_bot.infinity_polling()
 
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import platform
+import argparse
+import tempfile
+import datetime as dt
+
+from pvpc_bot.benchmarks.suite import run, compare
+from pvpc_bot.benchmarks.startup import cold_start, import_times, write_users
+from pvpc_bot.benchmarks.rendering import render_soak, check_soak
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+RESULTS_FILE = os.path.join(BENCHMARKS_DIR, "results.json")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m pvpc_bot.benchmarks")
+    parser.add_argument("benchmarks", nargs="*", help="only run the benchmarks whose name contains any of these")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=1.25, help="allowed slowdown of the median against the baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--require-baseline", action="store_true", help="fail when there is no baseline to compare with")
+    parser.add_argument("--startup", action="store_true", help="also measure the cold start and the import times")
+    parser.add_argument("--startup-budget", type=float, default=0.5, help="seconds from launch to the first /ayuda reply")
+    parser.add_argument("--users", type=int, default=2000, help="users in the settings loaded on start up")
+    parser.add_argument("--render", type=int, default=0, metavar="CHARTS", help="render this many charts checking time and memory stay flat")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="pvpc_benchmarks_") as tmp_dir:
+        results = run(tmp_dir, rounds=args.rounds, selected=args.benchmarks)
+
+    if args.startup:
+        print(f"{'slowest imports':<60}{'cumulative (ms)':>16}{'self (ms)':>12}")
+        for cumulative, self_time, name in import_times():
+            print(f"{name:<60}{cumulative * 1000:>16.1f}{self_time * 1000:>12.1f}")
+        print()
+
+        with tempfile.TemporaryDirectory(prefix="pvpc_startup_") as tmp_dir:
+            write_users(tmp_dir, args.users)
+            startup, matplotlib_imported = cold_start(tmp_dir)
+        results.update(startup)
+        if startup["startup.first_reply"]["median"] > args.startup_budget:
+            failures.append(f"STARTUP first /ayuda reply after {startup['startup.first_reply']['median']:.3f}s, budget {args.startup_budget}s")
+        if matplotlib_imported:
+            failures.append("STARTUP matplotlib imported before the first render")
+
+    if args.render:
+        with tempfile.TemporaryDirectory(prefix="pvpc_render_") as tmp_dir:
+            batches = render_soak(tmp_dir, charts=args.render)
+        print(f"{'charts rendered':<34}{'median (ms)':>14}{'rss (MiB)':>16}")
+        for batch in batches:
+            print(f"{batch['charts']:<34}{batch['median'] * 1000:>14.3f}{batch['rss'] / 2**20:>16.1f}")
+        print()
+        failures.extend(f"RENDER {failure}" for failure in check_soak(batches))
+
+    report = {
+        "date": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+    for path in (args.output, args.baseline) if args.save_baseline else (args.output,):
+        with open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(report, indent=2))
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "rt") as f:
+            baseline = json.loads(f.read())["results"]
+    elif not args.save_baseline:
+        # Timings depend on the machine, no baseline is committed: save one before comparing
+        message = f"NO BASELINE at '{args.baseline}', nothing compared: run with --save-baseline on this machine first"
+        if args.require_baseline:
+            failures.append(message)
+        else:
+            print(f"WARNING {message}\n")
+
+    print(f"{'benchmark':<34}{'median (ms)':>14}{'baseline (ms)':>16}{'ratio':>8}")
+    missing = [name for name in results if baseline and name not in baseline]
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get("median")
+        ratio = f"{result['median'] / reference:.2f}" if reference else "-"
+        reference = f"{reference * 1000:.3f}" if reference else "-"
+        print(f"{name:<34}{result['median'] * 1000:>14.3f}{reference:>16}{ratio:>8}")
+
+    if missing:
+        print(f"WARNING not in the baseline, not compared: {', '.join(missing)}")
+    regressions = compare(results, baseline, args.threshold)
+    for name, reference, median in regressions:
+        print(f"REGRESSION {name}: {reference * 1000:.3f} ms -> {median * 1000:.3f} ms (threshold x{args.threshold})")
+    for failure in failures:
+        print(failure)
+    return 1 if regressions or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import os
+import random
+import logging
+import datetime as dt
+from array import array
+from contextlib import contextmanager
+
+from pvpc_bot.config import GEOLOCATIONS
+
+
+BENCHMARK_DAY = dt.datetime(2022, 1, 31)
+
+
+def make_day_values(method: str, geolocation: str, date: 'dt.datetime', points: int=24) -> tuple:
+    # Same columns the price store returns, deterministic for every (method, geolocation, day)
+    rng = random.Random(f"{method}_{geolocation}_{date:%Y%m%d}_{points}")
+    if method == "sections":
+        # Sections are always hourly, finer prices exercise the alignment
+        return array("H", range(0, 1440, 60)), array("B", (rng.choice((1, 2, 3)) for _ in range(24)))
+    step = 1440 // points
+    return array("H", range(0, 1440, step)), array("d", (rng.uniform(50, 300) for _ in range(points)))
+
+
+def make_document(method: str, date: 'dt.datetime', points: int=24) -> dict:
+    # ESIOS shaped document with every geolocation, for the paths that still parse whole documents
+    geos, values = [], []
+    for geo_id, geolocation in enumerate(GEOLOCATIONS, start=8741):
+        geos.append({"geo_id": geo_id, "geo_name": geolocation})
+        for minutes, value in zip(*make_day_values(method, geolocation, date, points)):
+            values.append({
+                "value": value,
+                "datetime": f"{date:%Y-%m-%d}T{minutes // 60:02d}:{minutes % 60:02d}:00.000+01:00",
+                "geo_id": geo_id,
+                "geo_name": geolocation
+            })
+    return {"indicator": {"geos": geos, "values": values}}
+
+
+class FakeReeAPI:
+    points = 24
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_day_values(self, method: str, geolocation: str, year: int, month: int, day: int) -> tuple:
+        return make_day_values(method, geolocation, dt.datetime(year, month, day), self.points)
+
+
+class FakeMessage:
+    class Photo:
+        file_id = "benchmark_file_id"
+
+    id = 1
+    photo = [Photo()]
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = 0
+
+    def _call(self, *args, **kwargs) -> 'FakeMessage':
+        self.calls += 1
+        return FakeMessage()
+
+    send_photo = send_message = pin_chat_message = _call
+
+
+class FakeSettings:
+    def __init__(self, geolocation: str=GEOLOCATIONS[0], colors: str="percentiles"):
+        self.users = {1: {"timezone": geolocation, "colors": colors, "subscribed": True}}
+
+
+def make_alert_settings(tmp_dir: str, rules: int=100000) -> 'SettingsManager':
+    # Users spread over every geolocation, mostly price thresholds around the usual prices and some windows
+    from pvpc_bot.bot.user_settings import SettingsManager
+    from pvpc_bot.bot.settings_storage import JsonStorage
+
+    rng = random.Random(rules)
+    settings_manager = SettingsManager(restore_backup=False, storage=JsonStorage(tmp_dir))
+    for user_id in range(rules):
+        alert = {"type": "price", "threshold": round(rng.uniform(0.05, 0.3), 3)} if user_id % 10 else {"type": "window", "hours": rng.randint(1, 6)}
+        settings_manager._users[user_id] = {
+            "subscribed": False, "timezone": rng.choice(GEOLOCATIONS), "colors": "percentiles", "alerts": [alert]
+        }
+    settings_manager._reindex()
+    return settings_manager
+
+
+@contextmanager
+def isolated(tmp_dir: str, points: int=24):
+    # The analysis code reads its collaborators from module globals: swap them for fakes and temporary paths
+    from pvpc_bot.ree import price_analyzer
+    from pvpc_bot.bot.utils import file_ids, logs
+
+    image_dir = os.path.join(tmp_dir, f"graphs_{points}")
+    os.makedirs(image_dir, exist_ok=True)
+    previous = (price_analyzer.ReeAPI, price_analyzer.IMAGE_DIR, file_ids.file_id_cache, logs.get_logger().level)
+    FakeReeAPI.points = points
+    price_analyzer.ReeAPI = FakeReeAPI
+    price_analyzer.IMAGE_DIR = image_dir
+    file_ids.file_id_cache = file_ids.FileIdCache(os.path.join(tmp_dir, f"file_ids_{points}.json"))
+    logs.get_logger().setLevel(logging.WARNING)
+    price_analyzer.day_cache.invalidate(lambda key: True)
+    try:
+        yield image_dir
+    finally:
+        price_analyzer.ReeAPI, price_analyzer.IMAGE_DIR, file_ids.file_id_cache, level = previous
+        logs.get_logger().setLevel(level)
+        price_analyzer.day_cache.invalidate(lambda key: True)
@@ -0,0 +1,58 @@
+import os
+import time
+import statistics
+import datetime as dt
+
+from pvpc_bot.benchmarks.fixtures import BENCHMARK_DAY, isolated
+from pvpc_bot.config import GEOLOCATIONS, COLOR_SCHEMES
+
+
+def _rss() -> int:
+    # Current resident set size in bytes, the peak from getrusage would hide memory given back
+    try:
+        with open("/proc/self/statm", "rt") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def render_soak(tmp_dir: str, charts: int=2000, batches: int=10, points: int=24) -> list:
+    # Thousands of charts through the same template, as the prerender workers do:
+    # the per chart time and the memory of the process must stay flat from batch to batch
+    from pvpc_bot.ree.price_analyzer import PriceAnalyzer
+    from pvpc_bot.ree.chart_renderer import get_chart_renderer
+
+    with isolated(tmp_dir, points) as image_dir:
+        summaries = [
+            PriceAnalyzer(BENCHMARK_DAY + dt.timedelta(days=day), geolocation=geolocation).get_summary()
+            for day in range(7) for geolocation in GEOLOCATIONS
+        ]
+        chart_path = os.path.join(image_dir, "soak.png")
+        renderer = get_chart_renderer()
+        renderer.render(summaries[0], COLOR_SCHEMES[0], chart_path)
+
+        results, rendered = [], 0
+        for batch in range(batches):
+            timings = []
+            for _ in range(charts // batches):
+                summary = summaries[rendered % len(summaries)]
+                colors = COLOR_SCHEMES[rendered % len(COLOR_SCHEMES)]
+                start = time.perf_counter()
+                renderer.render(summary, colors, chart_path)
+                timings.append(time.perf_counter() - start)
+                rendered += 1
+            results.append({"batch": batch, "charts": rendered, "median": statistics.median(timings), "rss": _rss()})
+        os.remove(chart_path)
+    return results
+
+
+def check_soak(batches: list, time_growth: float=1.25, rss_growth: float=1.1) -> list:
+    # The first batch is the reference, later ones can not get much slower or bigger
+    failures = []
+    first, last = batches[0], batches[-1]
+    if last["median"] > first["median"] * time_growth:
+        failures.append(f"chart render went from {first['median'] * 1000:.2f} ms to {last['median'] * 1000:.2f} ms")
+    if last["rss"] > first["rss"] * rss_growth:
+        failures.append(f"memory went from {first['rss'] / 2**20:.1f} MiB to {last['rss'] / 2**20:.1f} MiB")
+    return failures
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+
+
+AYUDA_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private", "username": "benchmark"},
+        "from": {"id": 1, "is_bot": False, "first_name": "benchmark"},
+        "text": "/ayuda",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+    }
+}
+
+# Runs in a fresh interpreter: from nothing imported to the reply of the first /ayuda
+COLD_START = """
+import os, sys, json, time, threading
+start = time.perf_counter()
+tmp_dir = sys.argv[1]
+
+from pvpc_bot import config
+for handler in config.LOGGING_CONFIG["handlers"].values():
+    handler["filename"] = os.path.join(tmp_dir, os.path.basename(handler["filename"]))
+
+from telebot.types import Update
+from pvpc_bot.bot.bot import ReeBot
+from pvpc_bot.bot.user_settings import SettingsManager
+from pvpc_bot.bot.settings_storage import JsonStorage
+imported = time.perf_counter()
+
+bot = ReeBot(settings_manager=SettingsManager(storage=JsonStorage(tmp_dir), background=True))
+created = time.perf_counter()
+
+replied = threading.Event()
+bot.reply_to = lambda message, text, **kwargs: replied.set()
+bot.process_new_updates([Update.de_json(sys.argv[2])])
+replied.wait(30)
+print(json.dumps({
+    "import": imported - start,
+    "create": created - imported,
+    "first_reply": time.perf_counter() - start,
+    "matplotlib": "matplotlib" in sys.modules
+}))
+os._exit(0)
+"""
+
+
+def _environment() -> dict:
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+    return environment
+
+
+def write_users(tmp_dir: str, users: int) -> None:
+    for user_id in range(users):
+        with open(os.path.join(tmp_dir, f"{user_id}_settings.json"), "wt") as f:
+            f.write(json.dumps({"subscribed": True, "timezone": "Península", "colors": "percentiles"}))
+
+
+def cold_start(tmp_dir: str, rounds: int=3) -> tuple:
+    runs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START, tmp_dir, json.dumps(AYUDA_UPDATE)],
+            env=_environment(), capture_output=True, text=True, check=True
+        ).stdout
+        run = json.loads(output.strip().splitlines()[-1])
+        # Including the interpreter start up, as the service sees it
+        run["process"] = time.perf_counter() - start
+        runs.append(run)
+
+    results = {}
+    for stage in ("import", "create", "first_reply", "process"):
+        timings = [run[stage] for run in runs]
+        results[f"startup.{stage}"] = {"median": statistics.median(timings), "min": min(timings), "max": max(timings), "rounds": rounds}
+    return results, any(run["matplotlib"] for run in runs)
+
+
+def import_times(module: str="pvpc_bot.bot.bot", top: int=15) -> list:
+    # Same report as `python -X importtime`, the slowest imports by cumulative time
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_environment(), capture_output=True, text=True, check=True
+    ).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative) / 1e6, int(self_time) / 1e6, name.rstrip()))
+    return sorted(imports, reverse=True)[:top]
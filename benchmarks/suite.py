@@ -0,0 +1,102 @@
+import os
+import time
+import statistics
+import datetime as dt
+
+from pvpc_bot.benchmarks.fixtures import (
+    BENCHMARK_DAY, FakeBot, FakeSettings, make_document, make_alert_settings, isolated
+)
+from pvpc_bot.config import GEOLOCATIONS, COLOR_SCHEMES
+
+
+POINTS_PER_DAY = (24, 96)
+
+
+def measure(function: 'Callable', rounds: int, setup: 'Callable'=None) -> dict:
+    # One warm up call, then every round is timed on its own
+    if setup is not None:
+        setup()
+    function()
+    timings = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"median": statistics.median(timings), "min": min(timings), "max": max(timings), "rounds": rounds}
+
+
+def benchmarks(tmp_dir: str, points: int, image_dir: str) -> dict:
+    from pvpc_bot.ree.price_analyzer import PriceAnalyzer, day_cache
+    from pvpc_bot.ree.price_store import PriceStore
+    from pvpc_bot.ree.summary import DaySummary
+    from pvpc_bot.bot.utils.actions import find_best_lapse, send_report_message, report_cache
+    from pvpc_bot.bot.utils.alerts import evaluate_alerts
+
+    analyzers = [PriceAnalyzer(BENCHMARK_DAY, geolocation=geolocation) for geolocation in GEOLOCATIONS]
+    next_day = PriceAnalyzer(BENCHMARK_DAY + dt.timedelta(days=1))
+    two_days = analyzers[0].data + next_day.data
+    chart_path = os.path.join(image_dir, "benchmark.png")
+    documents = {method: make_document(method, BENCHMARK_DAY, points) for method in ("prices", "sections")}
+    store = PriceStore(os.path.join(tmp_dir, f"store_{points}"))
+    store.put_document(documents["prices"], "prices", BENCHMARK_DAY)
+    alert_settings = make_alert_settings(tmp_dir)
+
+    def render_charts():
+        for colors in COLOR_SCHEMES:
+            analyzers[0]._render_png(chart_path, colors)
+            os.remove(chart_path)
+
+    def clear_caches():
+        day_cache.invalidate(lambda key: True)
+        report_cache.invalidate(lambda key: True)
+
+    return {
+        # Every geolocation, as the daily prerender and report tasks do
+        "aggregate_data": (lambda: [pa._aggregate_data() for pa in analyzers], None),
+        "summary_cold": (
+            lambda: [DaySummary(pa.summary.day, pa._aggregate_data()) for pa in analyzers], None
+        ),
+        "get_summary_cached": (
+            lambda: [PriceAnalyzer(BENCHMARK_DAY, geolocation=geolocation).get_summary() for geolocation in GEOLOCATIONS], None
+        ),
+        "get_percentile": (lambda: [pa.get_percentile(percentile) for pa in analyzers for percentile in range(0, 101, 5)], None),
+        "find_best_lapse": (lambda: [find_best_lapse(lapse, two_days, top_k=10, non_overlapping=True) for lapse in (1, 3, 6)], None),
+        "generate_png": (render_charts, None),
+        # Summary and texts computed again, the chart file and its file_id are reused
+        "send_report_message_cold": (
+            lambda: send_report_message(FakeBot(), 1, BENCHMARK_DAY, settings_manager=FakeSettings()), clear_caches
+        ),
+        "send_report_message_warm": (
+            lambda: send_report_message(FakeBot(), 1, BENCHMARK_DAY, settings_manager=FakeSettings()), None
+        ),
+        "store_put_document": (
+            lambda: [store.put_document(document, method, BENCHMARK_DAY) for method, document in documents.items()], None
+        ),
+        "store_get_day": (lambda: [store.get_day("prices", geolocation, BENCHMARK_DAY) for geolocation in GEOLOCATIONS], None),
+        # 100k alert rules matched and their texts rendered, as on every publication
+        "evaluate_alerts": (lambda: evaluate_alerts(BENCHMARK_DAY, alert_settings), None)
+    }
+
+
+def run(tmp_dir: str, rounds: int=20, selected: 'Sequence[str]'=None) -> dict:
+    results = {}
+    for points in POINTS_PER_DAY:
+        with isolated(tmp_dir, points) as image_dir:
+            for name, (function, setup) in benchmarks(tmp_dir, points, image_dir).items():
+                name = f"{name}[{points}]"
+                if selected and not any(pattern in name for pattern in selected):
+                    continue
+                results[name] = measure(function, rounds, setup)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    # Benchmarks whose median got slower than the baseline by more than the threshold
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is not None and result["median"] > reference["median"] * threshold:
+            regressions.append((name, reference["median"], result["median"]))
+    return regressions
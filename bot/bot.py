@@ -1,5 +1,8 @@
 import re
 import os
+import math
+import html
+import threading
 import traceback
 import datetime as dt
 from functools import wraps
@@ -9,12 +12,19 @@ from telebot import apihelper
 
 from pvpc_bot.bot.user_settings import SettingsManager
 from pvpc_bot.bot.utils.keyboards import get_settings_keyboards
-from pvpc_bot.bot.utils.actions import send_report_message, send_best_lapse
+from pvpc_bot.bot.utils.actions import send_report_message, send_best_lapse, send_history_report
 from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.bot.utils.metrics import metrics
+from pvpc_bot.bot.utils.log_export import export_logs, parse_log_filters
+from pvpc_bot.bot.utils.alerts import enable_alerts
+from pvpc_bot.ree.prerender import enable_prerender
+from pvpc_bot.ree.rollups import enable_rollups
+from pvpc_bot.ree.cache_manager import enable_eviction
 from pvpc_bot.config import (
-    ADMINS, ADMIN_ENABLED, ADMIN_COMMANDS, BOT_TOKEN,
+    ADMINS, ADMIN_ENABLED, ADMIN_COMMANDS, BOT_TOKEN, BOT_MODE,
     WELCOME_STICKER, WELCOME_MESSAGE, HELP_MESSAGE,
-    TMP_DIR, LOGS_DIR, LOG_FILE_NAME, LOG_ERROR_FILE_NAME
+    TMP_DIR, LOGS_DIR, LOG_FILE_NAME, LOG_ERROR_FILE_NAME, HISTORY_PERIODS, HISTORY_DEFAULT_PERIOD,
+    ALERTS_PER_USER, ALERT_MAX_WINDOW
 )
 
 
@@ -33,6 +43,7 @@ def settings_phrases(user_settings: dict):
     }
 
 
+@metrics.timed("parse_message")
 def parse_message(message: str) -> dict:
     regex = r"/(\w+)(\s+\d+/\d+/\d+)?(\s+\d+)?"
     match = re.match(regex, message.text)
@@ -50,10 +61,50 @@ def parse_message(message: str) -> dict:
     return parsed_message
 
 
-def ReeBot(settings_manager: 'bot.user_settings.SettingsManager'=None):
-    settings_manager = settings_manager or SettingsManager()
+def alerts_phrase(user_settings: dict) -> str:
+    alerts = user_settings.get("alerts", [])
+    if not alerts:
+        return "No tienes alertas. Usa <i>/alertas precio X</i> o <i>/alertas ventana X</i> para crear una."
+
+    phrase = f"🔔 Tus alertas ({user_settings['timezone']}):\n"
+    for alert in alerts:
+        if alert["type"] == "price":
+            phrase += f"• Horas por debajo de {alert['threshold']} €/kWh\n"
+        else:
+            phrase += f"• Las {alert['hours']} horas seguidas más baratas\n"
+    return phrase
+
+
+def parse_alert(arguments: list) -> dict:
+    alert_type, value = arguments
+    if alert_type == "precio":
+        threshold = float(value.replace(",", "."))
+        # nan would break the order of the sorted thresholds every alert is bisected in
+        if not math.isfinite(threshold) or threshold <= 0:
+            raise ValueError(f"Invalid threshold {threshold}")
+        return {"type": "price", "threshold": threshold}
+    if alert_type == "ventana":
+        hours = int(value)
+        if not 1 <= hours <= ALERT_MAX_WINDOW:
+            raise ValueError(f"Invalid window {hours}")
+        return {"type": "window", "hours": hours}
+    raise ValueError(f"Unknown alert {alert_type}")
+
+
+def ReeBot(settings_manager: 'bot.user_settings.SettingsManager'=None, mode: str=BOT_MODE, threaded: bool=True):
+    settings_manager = settings_manager or SettingsManager(background=True)
+    enable_prerender()
+    enable_rollups()
+    enable_eviction()
     apihelper.ENABLE_MIDDLEWARE = True
-    _bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML")
+    if mode == "async":
+        # asyncio and aiohttp are only imported by the async mode
+        from pvpc_bot.bot.utils.async_bridge import SyncBridge
+        _bot = SyncBridge(BOT_TOKEN, parse_mode="HTML")
+    else:
+        # Not threaded: the handlers run in the caller (the webhook workers) instead of TeleBot's own pool
+        _bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML", threaded=threaded)
+    enable_alerts(_bot, settings_manager)
 
     """def safe_execution(function):
         def wrapper(obj):
@@ -72,7 +123,8 @@ def ReeBot(settings_manager: 'bot.user_settings.SettingsManager'=None):
             def wrapper(obj):
                 try:
                     log(obj=obj)
-                    function(obj)
+                    with metrics.timer(f"handler.{function.__name__}"):
+                        function(obj)
                 except Exception as e:
                     log(text=traceback.format_exc(), obj=obj, level="ERROR")
 
@@ -114,6 +166,41 @@ def ReeBot(settings_manager: 'bot.user_settings.SettingsManager'=None):
         else:
             send_report_message(_bot, user_id=message.chat.id, target_day=command_data["day"], sorted_data=True, settings_manager=settings_manager)
     
+    @_bot.message_handler(commands=['historico'])
+    @log_message(reply_message="Datos no disponibles, inténtalo mas tarde.")
+    def historico(message):
+        period, end_day = HISTORY_DEFAULT_PERIOD, parse_message(message)["day"]
+        for argument in message.text.split()[1:]:
+            if argument.lower() in HISTORY_PERIODS:
+                period = argument.lower()
+            else:
+                end_day = dt.datetime.strptime(argument, "%d/%m/%Y")
+        send_history_report(_bot, user_id=message.chat.id, end_day=end_day, period=period, settings_manager=settings_manager)
+
+    @_bot.message_handler(commands=['alertas'])
+    @log_message
+    def alertas(message):
+        user_id = message.chat.id
+        # Chats that never used /start get their settings, not the daily report
+        settings_manager.register_user(user_id, subscribed=False)
+        arguments = message.text.lower().split()[1:]
+        alerts = list(settings_manager.users[user_id].get("alerts", []))
+
+        if arguments == ["borrar"]:
+            settings_manager.set_config(user_id, "alerts", [])
+        elif arguments:
+            try:
+                alert = parse_alert(arguments)
+            except ValueError:
+                _bot.send_message(user_id, f"Uso: /alertas [precio X|ventana 1-{ALERT_MAX_WINDOW}|borrar]")
+                return
+            if len(alerts) >= ALERTS_PER_USER:
+                _bot.send_message(user_id, f"Como mucho puedes tener {ALERTS_PER_USER} alertas, borra alguna con /alertas borrar.")
+                return
+            if alert not in alerts:
+                settings_manager.set_config(user_id, "alerts", alerts + [alert])
+        _bot.send_message(user_id, alerts_phrase(settings_manager.users[user_id]))
+
     @_bot.message_handler(commands=["ajustes"])
     @log_message
     def settings(message):
@@ -154,12 +241,11 @@ def ReeBot(settings_manager: 'bot.user_settings.SettingsManager'=None):
     return _bot
 
 
-def admin_functions(_bot: 'telebot.TeleBot', settings_manager: 'bot.user_settings.SettingsManager'=None):
+def admin_functions(_bot: 'Any[telebot.TeleBot, SyncBridge]', settings_manager: 'bot.user_settings.SettingsManager'=None):
     settings_manager = settings_manager or SettingsManager()
 
     def is_admin(user_id: int) -> bool:
-        user_settings = settings_manager.users[user_id]
-        return "admin" in user_settings and user_settings["admin"]
+        return settings_manager.is_admin(user_id)
     
     def set_admins():
         for admin in ADMINS:
@@ -167,49 +253,45 @@ def admin_functions(_bot: 'telebot.TeleBot', settings_manager: 'bot.user_setting
                 settings_manager.set_config(admin, "admin", True)
     
     def get_all_admins():
-        return [user for user in settings_manager.users if settings_manager.users[user]["admin"]]
+        return settings_manager.get_admins()
     
     def get_logs(message, log_type):
-        def join_logs(final_log_file_path):
-            full_log_text = ""
-            for log_file in os.listdir(LOGS_DIR):
-                regex = re.compile(f"bot_{log_type}(.\d+-\d+-\d+)?.log")
-                match = re.match(regex, log_file)
-                if match:
-                    with open(os.path.join(LOGS_DIR, log_file), "rt") as f:
-                        full_log_text += f.read()
-
-            with open(final_log_file_path, "wt") as f:
-                f.write(full_log_text)
-        
         base_filename = LOG_ERROR_FILE_NAME if log_type == "errors" else LOG_FILE_NAME
-        message_text = message.text.split()
-        log_file_path = os.path.join(LOGS_DIR, base_filename)
-        if len(message_text) > 1:
-            if message_text[1].lower() == "all":
-                log_file_path = os.path.join(TMP_DIR, f"tmp_{log_type}_{message.chat.id}.log")
-                join_logs(log_file_path)
+        arguments = message.text.split()[1:]
+        if not arguments:
+            with open(os.path.join(LOGS_DIR, base_filename), "rb") as f:
+                _bot.send_document(message.chat.id, f)
+            return
+
+        try:
+            start_date, end_date, min_level = parse_log_filters(arguments)
+        except ValueError:
+            _bot.send_message(message.chat.id, "Uso: /logs [all|DD/MM/YYYY|DD/MM/YYYY-DD/MM/YYYY] [nivel]")
+            return
+
+        export_path = os.path.join(TMP_DIR, f"tmp_{log_type}_{message.chat.id}.log.gz")
+        try:
+            if export_logs(log_type, export_path, start_date, end_date, min_level):
+                with open(export_path, "rb") as f:
+                    _bot.send_document(message.chat.id, f)
             else:
-                date = dt.datetime.strptime("%d/%m/%Y")
-                log_file_path = os.path.join(LOGS_DIR, f"{base_filename.replace('.log', '')}.{date.strftime('%Y-%m-%d')}.log")
-        
-        with open(log_file_path, "rb") as f:
-            _bot.send_document(message.chat.id, f)
-        
-        if message_text[1].lower() == "all":
-            os.remove(log_file_path)
+                _bot.send_message(message.chat.id, "No hay registros para esas fechas.")
+        finally:
+            if os.path.exists(export_path):
+                os.remove(export_path)
     
     def check_admin(function):
         def wrapper(message):
             command, *_ = message.text.split()
             if command in ADMIN_COMMANDS and not is_admin(message.chat.id):
-                log(text=f"USER not ALLOWED TO EXECUTE ADMIN COMMAND '{command}'", message=message)
+                log("USER not ALLOWED TO EXECUTE ADMIN COMMAND '%s'", command, obj=message)
             else:
-                log(text=f"USER ALLOWED TO EXECUTE COMMAND '{command}'", message=message)
+                log("USER ALLOWED TO EXECUTE COMMAND '%s'", command, obj=message)
                 function(message)
         return wrapper
         
-    set_admins()
+    # Waits for the settings to be loaded, which must not delay the first answers
+    threading.Thread(target=set_admins, daemon=True).start()
 
     @_bot.message_handler(commands=['users'])
     @check_admin
@@ -218,8 +300,11 @@ def admin_functions(_bot: 'telebot.TeleBot', settings_manager: 'bot.user_setting
         if not os.path.exists(backup_path):
             settings_manager.backup_settings(system=True, backup_path=backup_path)
         
+        subscribers = settings_manager.get_subscribers()
+        summary = "\n".join(f"{timezone} ({colors}): {len(user_ids)}" for (timezone, colors), user_ids in sorted(subscribers.items()))
+        caption = f"Usuarios: {len(settings_manager.users)}\nSuscritos: {sum(map(len, subscribers.values()))}\n{summary}"
         with open(backup_path, "rb") as f:
-            _bot.send_document(message.chat.id, f)
+            _bot.send_document(message.chat.id, f, caption=caption)
         os.remove(backup_path)
     
     @_bot.message_handler(commands=['op'])
@@ -244,6 +329,11 @@ def admin_functions(_bot: 'telebot.TeleBot', settings_manager: 'bot.user_setting
         except (ValueError, IndexError):
             _bot.send_message(message.chat.id, f"Algo ha salido mal, inténtalo de nuevo.")
 
+    @_bot.message_handler(commands=['stats'])
+    @check_admin
+    def stats(message):
+        _bot.send_message(message.chat.id, f"<pre>{html.escape(metrics.get_stats())}</pre>")
+
     @_bot.message_handler(commands=['logs'])
     @check_admin
     def logs(message):
@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import atexit
+import time
+import sqlite3
+import threading
+
+from pvpc_bot.ree.utils import store_data, load_data
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.config import SETTINGS_DIR, SETTINGS_BACKEND, SETTINGS_DB, SETTINGS_FLUSH_INTERVAL
+
+
+class JsonStorage:
+    def __init__(self, settings_dir: str=SETTINGS_DIR):
+        self.settings_dir = settings_dir
+
+    def load_all(self) -> dict:
+        users = {}
+        for backup_file in os.listdir(self.settings_dir):
+            match = re.search(r"(\d+)_settings.json", backup_file)
+            if match:
+                users[int(match.group(1))] = load_data(os.path.join(self.settings_dir, backup_file))
+        return users
+
+    def save(self, user_id: int, data: dict) -> None:
+        store_data(json_data=data, file_path=os.path.join(self.settings_dir, f"{user_id}_settings.json"))
+
+    def flush(self) -> None:
+        pass
+
+
+class SqliteStorage:
+    def __init__(self, db_path: str=SETTINGS_DB, flush_interval: float=SETTINGS_FLUSH_INTERVAL, settings_dir: str=SETTINGS_DIR):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, settings TEXT NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._connection.commit()
+        self._db_mutex = threading.Lock()
+
+        # Only the last version of every user is written, however many times it changed in between
+        self._pending = {}
+        self._pending_mutex = threading.Lock()
+        self._pending_event = threading.Event()
+
+        self.migrate_json(settings_dir)
+        threading.Thread(target=self._writer, daemon=True).start()
+        atexit.register(self.flush)
+
+    def migrate_json(self, settings_dir: str=SETTINGS_DIR) -> int:
+        with self._db_mutex:
+            if self._connection.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            users = JsonStorage(settings_dir).load_all()
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO users (user_id, settings) VALUES (?, ?)",
+                    [(user_id, json.dumps(data, ensure_ascii=False)) for user_id, data in users.items()]
+                )
+                self._connection.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+        if users:
+            log("Migrated %s users from the JSON settings files to '%s'.", len(users), self.db_path, level="INFO")
+        return len(users)
+
+    def load_all(self) -> dict:
+        with self._db_mutex:
+            rows = self._connection.execute("SELECT user_id, settings FROM users").fetchall()
+        return {user_id: json.loads(settings) for user_id, settings in rows}
+
+    def save(self, user_id: int, data: dict) -> None:
+        # Serialized now, the caller keeps mutating its own dictionary
+        with self._pending_mutex:
+            self._pending[user_id] = json.dumps(data, ensure_ascii=False)
+        self._pending_event.set()
+
+    def flush(self) -> None:
+        with self._pending_mutex:
+            pending, self._pending = self._pending, {}
+            self._pending_event.clear()
+        if not pending:
+            return
+        try:
+            with self._db_mutex, self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO users (user_id, settings) VALUES (?, ?)",
+                    pending.items()
+                )
+        except sqlite3.Error:
+            # Keep them for the next flush, unless they were changed in the meantime
+            with self._pending_mutex:
+                self._pending = {**pending, **self._pending}
+                self._pending_event.set()
+            raise
+
+    def _writer(self) -> None:
+        while True:
+            self._pending_event.wait()
+            # Give the burst some time to coalesce in a single transaction
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                log("Could not store the settings in '%s': %r", self.db_path, e, level="ERROR")
+
+
+_storages = {}
+_storages_mutex = threading.Lock()
+def get_storage(backend: str=SETTINGS_BACKEND) -> 'Any[JsonStorage, SqliteStorage]':
+    # One per process: every SettingsManager shares the connection, the writer thread and the pending writes
+    with _storages_mutex:
+        if backend not in _storages:
+            _storages[backend] = {
+                "json": JsonStorage,
+                "sqlite": SqliteStorage
+            }[backend]()
+        return _storages[backend]
@@ -1,36 +1,160 @@
 import os
-import re
+import math
+import threading
+from array import array
 
+from pvpc_bot.bot.settings_storage import get_storage
+from pvpc_bot.bot.utils.logs import log
 from pvpc_bot.ree.utils import store_data, load_data
 from pvpc_bot.config import SETTINGS_DIR
 
 
 class SettingsManager:
-    def __init__(self, restore_backup=True):
-        self.users = {}
-        if restore_backup:
+    def __init__(self, restore_backup=True, storage: 'Any[JsonStorage, SqliteStorage]'=None, background: bool=False):
+        self._users = {}
+        self._loaded = threading.Event()
+        self.storage = storage or get_storage()
+
+        # Indexes: subscribed users by their report payload (timezone, colors) and the admins
+        self.subscribers = {}
+        self.admins = set()
+        # Alerts by geolocation: {(threshold, user_id)} and {hours: {user_id}}. The thresholds are sorted
+        # for the bulk evaluation only when they are read, the sorted arrays are kept until they change
+        self.price_alerts = {}
+        self.window_alerts = {}
+        self._sorted_price_alerts = {}
+        self._indexed = {}
+        self._index_mutex = threading.Lock()
+        if restore_backup and background:
+            # The bot can start answering while the users are read, only what needs them waits
+            threading.Thread(target=self._load_in_background, daemon=True).start()
+        else:
+            if restore_backup:
+                self.load_settings(system=True)
+            self._loaded.set()
+
+    def _load_in_background(self) -> None:
+        try:
             self.load_settings(system=True)
-    
+        except Exception as e:
+            log("Could not load the user settings: %r", e, level="ERROR")
+        finally:
+            self._loaded.set()
+
+    @property
+    def users(self) -> dict:
+        self._loaded.wait()
+        return self._users
+
+    def _index_user(self, user_id: int) -> None:
+        user_settings = self._users.get(user_id)
+        with self._index_mutex:
+            previous_bucket, previous_admin, previous_alerts = self._indexed.pop(user_id, (None, False, ()))
+            if previous_bucket is not None:
+                self.subscribers[previous_bucket].discard(user_id)
+                if not self.subscribers[previous_bucket]:
+                    del self.subscribers[previous_bucket]
+            if previous_admin:
+                self.admins.discard(user_id)
+            for alert in previous_alerts:
+                self._unindex_alert(user_id, *alert)
+
+            if user_settings is None:
+                return
+            bucket = (user_settings["timezone"], user_settings["colors"]) if user_settings["subscribed"] else None
+            is_admin = bool(user_settings.get("admin"))
+            alerts = tuple(
+                (user_settings["timezone"], alert["type"], alert["threshold"] if alert["type"] == "price" else alert["hours"])
+                for alert in user_settings.get("alerts", ())
+                # Stored before the thresholds were validated, a nan would break the sorted thresholds
+                if alert["type"] != "price" or math.isfinite(alert["threshold"])
+            )
+            if bucket is not None:
+                self.subscribers.setdefault(bucket, set()).add(user_id)
+            if is_admin:
+                self.admins.add(user_id)
+            for alert in alerts:
+                self._index_alert(user_id, *alert)
+            self._indexed[user_id] = (bucket, is_admin, alerts)
+
+    def _index_alert(self, user_id: int, geolocation: str, alert_type: str, value: 'Any[float, int]') -> None:
+        if alert_type == "price":
+            self.price_alerts.setdefault(geolocation, set()).add((value, user_id))
+            self._sorted_price_alerts.pop(geolocation, None)
+        else:
+            self.window_alerts.setdefault(geolocation, {}).setdefault(value, set()).add(user_id)
+
+    def _unindex_alert(self, user_id: int, geolocation: str, alert_type: str, value: 'Any[float, int]') -> None:
+        if alert_type == "price":
+            self.price_alerts[geolocation].discard((value, user_id))
+            self._sorted_price_alerts.pop(geolocation, None)
+        else:
+            self.window_alerts[geolocation][value].discard(user_id)
+            if not self.window_alerts[geolocation][value]:
+                del self.window_alerts[geolocation][value]
+
+    def _reindex(self) -> None:
+        with self._index_mutex:
+            self.subscribers, self.admins, self._indexed = {}, set(), {}
+            self.price_alerts, self.window_alerts, self._sorted_price_alerts = {}, {}, {}
+        for user_id in list(self._users):
+            self._index_user(user_id)
 
-    def register_user(self, user_id: int):
+    def get_subscribers(self) -> dict:
+        self._loaded.wait()
+        with self._index_mutex:
+            return {bucket: list(user_ids) for bucket, user_ids in self.subscribers.items()}
+
+    def get_admins(self) -> list:
+        self._loaded.wait()
+        with self._index_mutex:
+            return list(self.admins)
+
+    def get_price_alerts(self, geolocation: str) -> tuple:
+        # (thresholds, user_ids) sorted by threshold, ready to be bisected
+        self._loaded.wait()
+        with self._index_mutex:
+            if geolocation not in self._sorted_price_alerts:
+                alerts = sorted(self.price_alerts.get(geolocation, ()))
+                self._sorted_price_alerts[geolocation] = (
+                    array("d", (threshold for threshold, _ in alerts)),
+                    array("q", (user_id for _, user_id in alerts))
+                )
+            return self._sorted_price_alerts[geolocation]
+
+    def get_window_alerts(self, geolocation: str) -> dict:
+        self._loaded.wait()
+        with self._index_mutex:
+            return {hours: list(user_ids) for hours, user_ids in self.window_alerts.get(geolocation, {}).items()}
+
+    def is_admin(self, user_id: int) -> bool:
+        self._loaded.wait()
+        return user_id in self.admins
+
+
+    def register_user(self, user_id: int, subscribed: bool=True):
         if user_id not in self.users:
             self.users[user_id] = {
-                "subscribed": True,
+                "subscribed": subscribed,
                 "timezone": "Península",
                 "colors": "percentiles"
             }
+            self._index_user(user_id)
             self.backup_settings(user_id=user_id)
     
     def set_config(self, user_id: int, property_name: str, property_value: 'Any') -> None:
         if user_id not in self.users:
             self.register_user(user_id)
         self.users[user_id][property_name] = property_value
+        self._index_user(user_id)
         self.backup_settings(user_id=user_id)
     
     def backup_settings(self, user_id: int=None, system: bool=False, backup_path: str=None):
         def save_user_data(user_id, data):
-            backup_file = backup_path or os.path.join(SETTINGS_DIR, f"{user_id}_settings.json")
-            store_data(json_data=data, file_path=backup_file)
+            if backup_path:
+                store_data(json_data=data, file_path=backup_path)
+            else:
+                self.storage.save(user_id, data)
         
         if not system and all(param is None for param in (user_id, backup_path)):
             raise Exception("Either user_id must be provided or backup_path must be enabled when not backing up the whole system.")
@@ -49,17 +173,16 @@ class SettingsManager:
         if not system and all(param is None for param in (user_id, backup_path)):
             raise Exception("Either user_id must be provided or backup_path must be enabled when not restoring the whole system.")
         
-        backup_file = backup_path or os.path.join(SETTINGS_DIR, "system_settings.json" if system else f"{user_id}_settings.json")
+        if system and not backup_path:
+            self._users.update(self.storage.load_all())
+            self._reindex()
+            return
+
+        backup_file = backup_path or os.path.join(SETTINGS_DIR, f"{user_id}_settings.json")
         data = load_data(backup_file)
         if system:
-            if backup_path:
-                self.users = {int(key): value for key, value in data.items()}
-            else:
-                for backup_file in os.listdir(SETTINGS_DIR):
-                    match = re.search(r"(\d+)_settings.json", backup_file)
-                    if match:
-                        user_id = int(match.group(1))
-                        data = load_data(os.path.join(SETTINGS_DIR, backup_file))
-                        self.users[user_id] = data
+            self._users = {int(key): value for key, value in data.items()}
+            self._reindex()
         else:
-            self.users[user_id] = data
+            self._users[user_id] = data
+            self._index_user(user_id)
@@ -1,99 +1,200 @@
+import requests
 import datetime as dt
 
 from pvpc_bot.ree.price_analyzer import PriceAnalyzer
+from pvpc_bot.ree.ree_api import DocumentNotFound, ResponseError
+from pvpc_bot.ree.lapses import cheapest_windows
+from pvpc_bot.ree.rollups import get_rollup_store, generate_history_png
+from pvpc_bot.ree.utils import LRUCache
 from pvpc_bot.bot.user_settings import SettingsManager
 from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.bot.utils.metrics import metrics
+from pvpc_bot.bot.utils.file_ids import send_cached_photo
 from pvpc_bot.bot.utils.images import get_image_title
 from pvpc_bot.bot.utils.sections import get_color_info, get_section
-from pvpc_bot.config import ROUND_DECIMALS, LOW_PERCENTILE, HIGH_PERCENTILE
+from pvpc_bot.config import (
+    ROUND_DECIMALS, LOW_PERCENTILE, HIGH_PERCENTILE, REPORT_CACHE_SIZE, LAPSE_TOP_K, LAPSE_NON_OVERLAPPING,
+    HISTORY_PERIODS
+)
+
+
+# Rendered texts, keyed by (day, geolocation, version) of the summaries they were built from:
+# a new version of the day is rendered again, and the keys do not keep the summaries alive
+report_cache = LRUCache(REPORT_CACHE_SIZE)
+metrics.add_collector("report_cache", report_cache.stats)
 
 
 def send_report_message(bot: 'telebot.TeleBot', user_id: int, target_day: 'dt.datetime', sorted_data: bool=False, pin_message: bool=False, settings_manager: 'SettingsManager'=None) -> None:
     settings_manager = settings_manager or SettingsManager()
 
-    log(text=f"Sending report message to {user_id} for day {target_day}.", level="INFO")
+    log("Sending report message to %s for day %s.", user_id, target_day, level="INFO")
 
     user_settings = settings_manager.users[user_id]
-    pa = PriceAnalyzer(target_day, geolocation=user_settings["timezone"])
-    data_summary = pa.get_summary()
+    with metrics.timer("report.prepare"):
+        report = prepare_report(target_day, user_settings["timezone"], user_settings["colors"], sorted_data)
+    with metrics.timer("report.upload"):
+        send_prepared_report(bot, user_id, report, pin_message)
 
-    user_colors = "sections" if user_settings["colors"] == "tramos" else user_settings["colors"]
-    data_list = data_summary["data"][user_colors]["list"]
-    if sorted_data:
-        data_list = sorted(data_list, key=lambda x: x["price"])
-    
-    report = f"ℹ Colores según {user_settings['colors']}.\n"
+
+def prepare_report(target_day: 'dt.datetime', geolocation: str, colors: str, sorted_data: bool=False) -> dict:
+    pa = PriceAnalyzer(target_day, geolocation=geolocation)
+    summary = pa.get_summary()
+    caption, prices = report_cache.get_or_create(
+        ("report", summary.day.date(), geolocation, summary.version, colors, sorted_data),
+        lambda: render_report(summary, colors, sorted_data)
+    )
+    return {
+        "image": pa.generate_png(colors="sections" if colors == "tramos" else colors),
+        "caption": caption,
+        "prices": prices
+    }
+
+
+def send_prepared_report(bot: 'telebot.TeleBot', user_id: int, report: dict, pin_message: bool=False) -> None:
+    # The graph
+    to_pin = send_cached_photo(bot, user_id, report["image"], caption=report["caption"])
+    bot.send_message(user_id, report["prices"])
+
+    if pin_message:
+        bot.pin_chat_message(user_id, to_pin.id)
+
+
+def render_report(data_summary: 'DaySummary', colors: str, sorted_data: bool=False) -> 'tuple[str]':
+    data_indexes = data_summary.order if sorted_data else range(len(data_summary.data))
+
+    report = f"ℹ Colores según {colors}.\n"
     if sorted_data:
         report += f"ℹ Precios ordenados de menor a mayor.\n"
-    
-    report += f"\n<b><u>{get_image_title(target_day)}</u></b>\n"
-    
+
+    report += f"\n<b><u>{get_image_title(data_summary.day)}</u></b>\n"
+
     # Some statistics
     report += "<pre>"
     for text, data_index in [('🔼 Precio máximo', 'max'), ('🔽 Precio mínimo', 'min')]:
-        report += f"{text} ({data_summary[data_index]['datetime'].strftime('%H')}h): {round(data_summary[data_index]['price'], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n"
+        price = getattr(data_summary, data_index)
+        report += f"{text} ({price['datetime'].strftime('%H')}h): {round(price['price'], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n"
     report += "</pre>\n<pre>"
 
     for text, data_index in [('📊 Media del día', 'mean'), (f'📈 Percentil {LOW_PERCENTILE}%', 'low_percentile'), (f'📉 Percentil {HIGH_PERCENTILE}%', 'high_percentile')]:
-        report += f"{text}: {round(data_summary[data_index], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n"
+        report += f"{text}: {round(getattr(data_summary, data_index), ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n"
     report += "</pre>\n<pre>"
 
     for text, data_index in [('🟢 Media Valle', 'low'), ('🟠 Media Llano', 'mid'), ('🔴 Media Punta', 'high')]:
-        if data_summary['data']['sections'][data_index]['mean'] > 0:
-            report += f"{text}: {round(data_summary['data']['sections'][data_index]['mean'], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n"
-    
+        if data_summary.section_means[data_index] > 0:
+            report += f"{text}: {round(data_summary.section_means[data_index], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n"
+
     # The real price list
     report += "</pre>"
-    
+
     prices = "<pre>"
-    for price in data_list:
+    for i in data_indexes:
+        price = data_summary.data[i]
         color_emoji, color_section, _ = get_color_info(price["section"])
-        if user_settings['colors'] == "percentiles":
-            color_emoji, _, _ = get_color_info(price["percentile_section"])
+        if colors == "percentiles":
+            color_emoji, _, _ = get_color_info(data_summary.percentile_sections[i])
         time_start = price["datetime"].strftime("%Hh")
         time_end = (price["datetime"] + dt.timedelta(hours=1)).strftime("%Hh")
         formated_price = round(price['price'], ROUND_DECIMALS)
-        
-        prices += f"{color_emoji}{color_section if user_settings['colors'] == 'percentiles' else ''}\t{time_start} - {time_end}:\t{formated_price:<{ROUND_DECIMALS + 2}} €/kWh\n"
 
-    prices +="</pre>"
-    
-    # The graph
-    image_path = pa.generate_png(colors=user_colors)
-    with open(image_path, "rb") as f:
-        to_pin = bot.send_photo(user_id, f, caption=report)
-    bot.send_message(user_id, prices)
+        prices += f"{color_emoji}{color_section if colors == 'percentiles' else ''}\t{time_start} - {time_end}:\t{formated_price:<{ROUND_DECIMALS + 2}} €/kWh\n"
 
-    if pin_message:
-        bot.pin_chat_message(user_id, to_pin.id)
+    prices +="</pre>"
+    return report, prices
 
 
+@metrics.timed("report.lapse")
 def send_best_lapse(bot: 'telebot.TeleBot', user_id: int, target_day: 'dt.datetime', lapse: int, settings_manager: 'SettingsManager'=None) -> None:
     settings_manager = settings_manager or SettingsManager()
-    pa = PriceAnalyzer(target_day, geolocation=settings_manager.users[user_id]["timezone"])
+    geolocation = settings_manager.users[user_id]["timezone"]
+    pa = PriceAnalyzer(target_day, geolocation=geolocation)
+
+    # The search goes on into the next day when its prices are already published, and can be fetched
+    try:
+        next_summary = PriceAnalyzer(target_day + dt.timedelta(days=1), geolocation=geolocation).get_summary()
+    except DocumentNotFound:
+        next_summary = None
+    except (ResponseError, requests.RequestException) as e:
+        log("Could not get the next day of %s, searching a single day: %r", target_day, e, level="WARNING")
+        next_summary = None
+
     summary = pa.get_summary()
+    report = report_cache.get_or_create(
+        ("lapse", summary.day.date(), geolocation, summary.version, next_summary.version if next_summary is not None else None, lapse),
+        lambda: render_best_lapse(summary, lapse, next_summary)
+    )
+    bot.send_message(user_id, report)
 
-    report = f"<b><u>{get_image_title(target_day)}: Análisis estadístico.</u></b>\n\n"
-    report += f"ℹ Colores según percentiles.\nℹ Búsqueda de lapsos de tiempo de {lapse} horas, ordenadas de menor a mayor precio.\n\n"
 
-    for lapse_group in find_best_lapse(lapse, pa.data):
-        group_mean = lapse_group["sum"] / lapse
-        color, _, _ = get_color_info(get_section(group_mean, summary["low_percentile"], summary["high_percentile"]))
+def render_best_lapse(summary: 'DaySummary', lapse: int, next_summary: 'DaySummary'=None) -> str:
+    price_data = summary.data + (next_summary.data if next_summary is not None else ())
+    horizon = "ambos días" if next_summary is not None else "el día"
 
-        report += f"<pre>{color} [{lapse_group['start']}h - {lapse_group['end']}h]:\nPrecio total: {round(lapse_group['sum'], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kW ({lapse}h)\nPrecio medio: {round(group_mean, ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n\n</pre>"
-    bot.send_message(user_id, report)
+    report = f"<b><u>{get_image_title(summary.day)}: Análisis estadístico.</u></b>\n\n"
+    report += f"ℹ Colores según percentiles.\nℹ Búsqueda de lapsos de tiempo de {lapse} horas en {horizon}, ordenadas de menor a mayor precio.\n\n"
 
+    for lapse_group in find_best_lapse(lapse, price_data, top_k=LAPSE_TOP_K, non_overlapping=LAPSE_NON_OVERLAPPING):
+        group_mean = lapse_group["mean"]
+        color, _, _ = get_color_info(get_section(group_mean, summary.low_percentile, summary.high_percentile))
 
-def find_best_lapse(lapse: int, price_data: dict) -> list:
-    def leading_zero(n: int) -> str:
-        if n % 10 == n:
-            return f"0{n}"
-        return str(n)
-    return sorted(
-        [
-            {"start": leading_zero(i), "end": leading_zero((i+lapse)%24), "sum": sum(map(lambda x: x["price"], tmp))}
-            for i in range(len(price_data))
-            if len(tmp := price_data[i:i+lapse]) == lapse
-        ],
-        key=lambda x: x["sum"]
-    )
+        report += f"<pre>{color} [{lapse_group['start']} - {lapse_group['end']}]:\nPrecio total: {round(lapse_group['sum'], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kW ({lapse}h)\nPrecio medio: {round(group_mean, ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n\n</pre>"
+    return report
+
+
+def find_best_lapse(lapse: int, price_data: 'Sequence[dict]', top_k: int=None, non_overlapping: bool=False) -> list:
+    if not price_data:
+        return []
+    first_day = price_data[0]["datetime"].date()
+
+    # Windows are measured in hours, the data may have several points per hour
+    step = price_data[1]["datetime"] - price_data[0]["datetime"] if len(price_data) > 1 else dt.timedelta(hours=1)
+    points_per_hour = max(round(dt.timedelta(hours=1) / step), 1)
+    length = lapse * points_per_hour
+    # Sub-hourly windows may start at any quarter, the whole hour would not tell them apart
+    label_format = "%H:%M" if points_per_hour > 1 else "%Hh"
+
+    def hour_label(datetime: 'dt.datetime') -> str:
+        days = (datetime.date() - first_day).days
+        return datetime.strftime(label_format) + (f" (+{days})" if days else "")
+
+    windows = cheapest_windows([price["price"] for price in price_data], length, top_k, non_overlapping)
+    return [
+        {
+            "start": hour_label(price_data[start]["datetime"]),
+            "end": hour_label(price_data[start]["datetime"] + dt.timedelta(hours=lapse)),
+            "sum": total / points_per_hour,
+            "mean": total / length
+        }
+        for total, start in windows
+    ]
+
+
+@metrics.timed("report.history")
+def send_history_report(bot: 'telebot.TeleBot', user_id: int, end_day: 'dt.datetime', period: str, settings_manager: 'SettingsManager'=None) -> None:
+    settings_manager = settings_manager or SettingsManager()
+    geolocation = settings_manager.users[user_id]["timezone"]
+    start_day = end_day - dt.timedelta(days=HISTORY_PERIODS[period] - 1)
+
+    stats = get_rollup_store().get_stats(geolocation, start_day.date(), end_day.date())
+    if stats is None:
+        bot.send_message(user_id, "No hay datos para ese periodo.")
+        return
+    send_cached_photo(bot, user_id, generate_history_png(stats), caption=render_history(stats, period))
+
+
+def render_history(stats: dict, period: str) -> str:
+    report = f"<b><u>Histórico ({period}): {get_image_title(stats['start'])} - {get_image_title(stats['end'])}</u></b>\n"
+    report += f"ℹ {stats['geolocation']}, {stats['days']} días con datos.\n\n<pre>"
+    for text, data_index in [('🔼 Precio máximo', 'max'), ('🔽 Precio mínimo', 'min')]:
+        price = stats[data_index]
+        report += f"{text} ({price['datetime'].strftime('%d/%m %H')}h): {price['price']:<{ROUND_DECIMALS + 2}} €/kWh\n"
+    report += "</pre>\n<pre>"
+
+    for text, data_index in [('📊 Media', 'mean'), (f'📈 Percentil {LOW_PERCENTILE}%', 'low_percentile'), (f'📉 Percentil {HIGH_PERCENTILE}%', 'high_percentile')]:
+        report += f"{text}: {stats[data_index]:<{ROUND_DECIMALS + 2}} €/kWh\n"
+    report += "</pre>\n<pre>"
+
+    for text, data_index in [('🟢 Media Valle', 'low'), ('🟠 Media Llano', 'mid'), ('🔴 Media Punta', 'high')]:
+        if stats["section_means"][data_index] > 0:
+            report += f"{text}: {stats['section_means'][data_index]:<{ROUND_DECIMALS + 2}} €/kWh\n"
+    report += "</pre>"
+    return report
@@ -0,0 +1,118 @@
+import threading
+import datetime as dt
+from bisect import bisect_right
+
+from pvpc_bot.ree.ree_api import ReeCache, DocumentNotFound
+from pvpc_bot.ree.price_analyzer import PriceAnalyzer
+from pvpc_bot.bot.user_settings import SettingsManager
+from pvpc_bot.bot.utils.actions import find_best_lapse
+from pvpc_bot.bot.utils.delivery import DeliveryEngine
+from pvpc_bot.bot.utils.images import get_image_title
+from pvpc_bot.bot.utils.sections import get_color_info
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.bot.utils.metrics import metrics
+from pvpc_bot.config import GEOLOCATIONS, ROUND_DECIMALS
+
+
+def match_price_alerts(summary: 'DaySummary', thresholds: 'Sequence[float]') -> list:
+    # A threshold above the k cheapest prices and not above the next one matches exactly those k prices:
+    # one bisect per price splits the sorted thresholds in (count, start, end) groups sharing the same hours
+    prices = [summary.data[i]["price"] for i in summary.order]
+    groups = []
+    start = bisect_right(thresholds, prices[0])
+    for count in range(1, len(prices) + 1):
+        end = bisect_right(thresholds, prices[count]) if count < len(prices) else len(thresholds)
+        if end > start:
+            groups.append((count, start, end))
+        start = end
+    return groups
+
+
+def render_price_lines(summary: 'DaySummary') -> list:
+    # One line per price of the day, the hours of every group are a selection of them
+    # The spacing of the points, not the day split in equal parts: DST days have 23 or 25 hours
+    data = summary.data
+    step = data[1]["datetime"] - data[0]["datetime"] if len(data) > 1 else dt.timedelta(hours=1)
+    lines = []
+    for price, percentile_section in zip(summary.data, summary.percentile_sections):
+        color_emoji, _, _ = get_color_info(percentile_section)
+        lines.append(f"{color_emoji} {price['datetime']:%H:%M} - {price['datetime'] + step:%H:%M}:\t{round(price['price'], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh\n")
+    return lines
+
+
+def render_window_alert(summary: 'DaySummary', hours: int) -> str:
+    report = f"<b><u>🔔 {get_image_title(summary.day)}</u></b>\n"
+    report += f"ℹ Las {hours} horas seguidas más baratas:\n\n"
+    for lapse_group in find_best_lapse(hours, summary.data, top_k=1):
+        report += f"<pre>[{lapse_group['start']} - {lapse_group['end']}]:\nPrecio medio: {round(lapse_group['mean'], ROUND_DECIMALS):<{ROUND_DECIMALS + 2}} €/kWh</pre>"
+    return report
+
+
+@metrics.timed("alerts.evaluate")
+def evaluate_alerts(date: 'dt.datetime', settings_manager: 'SettingsManager'=None) -> list:
+    # Every alert of every user at once: one summary per geolocation, each text rendered once per group of users
+    settings_manager = settings_manager or SettingsManager()
+    alerts = []
+    for geolocation in GEOLOCATIONS:
+        thresholds, user_ids = settings_manager.get_price_alerts(geolocation)
+        windows = settings_manager.get_window_alerts(geolocation)
+        if not thresholds and not windows:
+            continue
+        try:
+            summary = PriceAnalyzer(date, geolocation=geolocation).get_summary()
+        except DocumentNotFound as e:
+            log("No prices to evaluate the alerts of %s on %s: %r", geolocation, date, e, level="WARNING")
+            continue
+
+        # Texts are (header, per user line, hours) parts, only joined when they are sent
+        title = f"<b><u>🔔 {get_image_title(summary.day)}</u></b>\n"
+        lines = render_price_lines(summary)
+        for count, start, end in match_price_alerts(summary, thresholds):
+            hours = f"<pre>{''.join(lines[i] for i in sorted(summary.order[:count]))}</pre>"
+            parts = None
+            for i in range(start, end):
+                # Thresholds are sorted, users with the same one share the whole text
+                if parts is None or thresholds[i] != thresholds[i - 1]:
+                    parts = (title, f"ℹ {count} precios por debajo de {thresholds[i]} €/kWh:\n", hours)
+                alerts.append((user_ids[i], parts))
+
+        for hours, window_user_ids in windows.items():
+            report = (render_window_alert(summary, hours),)
+            alerts.extend((user_id, report) for user_id in window_user_ids)
+    return alerts
+
+
+def send_alerts(bot: 'telebot.TeleBot', date: 'dt.datetime', settings_manager: 'SettingsManager'=None) -> dict:
+    alerts = evaluate_alerts(date, settings_manager)
+    log("Sending %s alerts for day %s.", len(alerts), date, level="INFO")
+    if not alerts:
+        return {}
+
+    def send(rate_limited_bot, alert):
+        user_id, parts = alert
+        rate_limited_bot.send_message(user_id, "".join(parts))
+
+    stats = DeliveryEngine(bot).deliver(alerts, send)
+    log("Alerts for day %s finished: %s", date, stats, level="INFO")
+    return stats
+
+
+_alerted_days = set()
+_alerts_mutex = threading.Lock()
+def enable_alerts(bot: 'telebot.TeleBot', settings_manager: 'SettingsManager') -> None:
+    def on_day_ready(date):
+        # Alerts are about the upcoming prices, and each day is only announced once
+        if date.date() < dt.date.today():
+            return
+        with _alerts_mutex:
+            if date in _alerted_days:
+                return
+            _alerted_days.add(date)
+        threading.Thread(target=safe_send_alerts, args=(date,), daemon=True).start()
+
+    def safe_send_alerts(date):
+        try:
+            send_alerts(bot, date, settings_manager)
+        except Exception as e:
+            log("Could not send the alerts for day %s: %r", date, e, level="ERROR")
+    ReeCache.add_day_listener(on_day_ready)
@@ -0,0 +1,70 @@
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pvpc_bot.config import BOT_WORKERS
+
+
+class SyncBridge:
+    # Exposes an AsyncTeleBot with the TeleBot interface: the Telegram I/O runs in the event loop,
+    # while the handlers (ESIOS fetches, PriceAnalyzer, rendering) run in a bounded thread pool
+    def __init__(self, token: str, parse_mode: str=None, workers: int=BOT_WORKERS):
+        # aiohttp is only imported when the async mode is used
+        from telebot.async_telebot import AsyncTeleBot
+
+        self.async_bot = AsyncTeleBot(token, parse_mode=parse_mode)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handler")
+        self.loop = None
+
+    def __getattr__(self, name: str) -> 'Any':
+        attribute = getattr(self.async_bot, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        def blocking_call(*args, **kwargs):
+            return self.run(attribute(*args, **kwargs))
+        return blocking_call
+
+    def run(self, coroutine: 'Coroutine') -> 'Any':
+        if self.loop is None or not self.loop.is_running():
+            return asyncio.run(coroutine)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            raise RuntimeError("Blocking bot calls can not be made from the event loop thread.")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _offload(self, function: 'Callable') -> 'Callable':
+        async def handler(obj):
+            await asyncio.get_running_loop().run_in_executor(self.executor, function, obj)
+        return handler
+
+    def message_handler(self, **kwargs) -> 'Callable':
+        def decorator(function):
+            self.async_bot.message_handler(**kwargs)(self._offload(function))
+            return function
+        return decorator
+
+    def callback_query_handler(self, func: 'Callable', **kwargs) -> 'Callable':
+        def decorator(function):
+            self.async_bot.callback_query_handler(func, **kwargs)(self._offload(function))
+            return function
+        return decorator
+
+    async def _polling(self, *args, **kwargs) -> None:
+        self.loop = asyncio.get_running_loop()
+        await self.async_bot.infinity_polling(*args, **kwargs)
+
+    def start_loop(self) -> None:
+        # Without polling (webhook mode) the loop still has to run somewhere for the bot calls
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="bot_loop", daemon=True).start()
+
+    def infinity_polling(self, *args, **kwargs) -> None:
+        try:
+            asyncio.run(self._polling(*args, **kwargs))
+        finally:
+            self.executor.shutdown(wait=True)
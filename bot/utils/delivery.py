@@ -0,0 +1,134 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+from pvpc_bot.ree.utils import LatencyStats
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.config import DELIVERY_WORKERS, DELIVERY_GLOBAL_RATE, DELIVERY_CHAT_RATE, DELIVERY_MAX_RETRIES
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._mutex = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._mutex:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Negative tokens are reservations, every caller waits for its own slot
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._mutex:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class ChatRateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = {}
+        self._mutex = threading.Lock()
+
+    def acquire(self, chat_id: int) -> None:
+        with self._mutex:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(chat_id, now))
+            self._next_slot[chat_id] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RateLimitedBot:
+    def __init__(self, bot: 'telebot.TeleBot', engine: 'DeliveryEngine'):
+        self._bot = bot
+        self._engine = engine
+
+    def __getattr__(self, name: str) -> 'Any':
+        attribute = getattr(self._bot, name)
+        if not (name.startswith("send_") or name in ("pin_chat_message", "edit_message_text")):
+            return attribute
+
+        def rate_limited(*args, **kwargs):
+            chat_id = kwargs.get("chat_id", args[0] if args else None)
+            return self._engine.call(attribute, chat_id, *args, **kwargs)
+        return rate_limited
+
+
+class DeliveryEngine:
+    def __init__(self, bot: 'telebot.TeleBot', workers: int=DELIVERY_WORKERS, global_rate: float=DELIVERY_GLOBAL_RATE,
+                 chat_rate: float=DELIVERY_CHAT_RATE, max_retries: int=DELIVERY_MAX_RETRIES):
+        self.bot = RateLimitedBot(bot, self)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.global_limiter = RateLimiter(global_rate, burst=global_rate)
+        self.chat_limiter = ChatRateLimiter(chat_rate)
+
+        self.latency = LatencyStats()
+        self.messages = 0
+        self.rate_limited = 0
+        self._mutex = threading.Lock()
+
+    def call(self, method: 'Callable', chat_id: int, *args, **kwargs) -> 'Any':
+        for attempt in range(self.max_retries + 1):
+            self.chat_limiter.acquire(chat_id)
+            self.global_limiter.acquire()
+            try:
+                response = method(*args, **kwargs)
+                with self._mutex:
+                    self.messages += 1
+                return response
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.max_retries:
+                    raise
+                retry_after = e.result_json.get("parameters", {}).get("retry_after", 2 ** attempt)
+                with self._mutex:
+                    self.rate_limited += 1
+                log("Rate limited sending to %s, retrying in %ss (attempt %s).", chat_id, retry_after, attempt + 1, level="WARNING")
+                # Flood limits are shared, every worker backs off, not only this one
+                backoff = retry_after + random.uniform(0, 1)
+                self.global_limiter.pause(backoff)
+                time.sleep(backoff)
+
+    def deliver(self, recipients: 'Iterable', send: 'Callable[[RateLimitedBot, Any], None]') -> dict:
+        delivered, failed = [], []
+
+        def deliver_to(recipient):
+            start = time.perf_counter()
+            try:
+                send(self.bot, recipient)
+                delivered.append(recipient)
+            except Exception as e:
+                log("Could not deliver to %s: %r", recipient, e, level="ERROR")
+                failed.append(recipient)
+            self.latency.add(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        # Recipients are pulled from the iterable as the workers free up, only a couple per worker wait queued
+        pending = threading.BoundedSemaphore(2 * self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for recipient in recipients:
+                pending.acquire()
+                executor.submit(deliver_to, recipient).add_done_callback(lambda _: pending.release())
+        elapsed = time.perf_counter() - start
+
+        return {
+            "delivered": len(delivered),
+            "failed": len(failed),
+            "messages": self.messages,
+            "rate_limited": self.rate_limited,
+            "seconds": elapsed,
+            "users_per_second": len(delivered) / elapsed if elapsed else 0,
+            "messages_per_second": self.messages / elapsed if elapsed else 0,
+            "latency": self.latency.summary()
+        }
@@ -0,0 +1,91 @@
+import os
+import hashlib
+import threading
+
+from telebot.apihelper import ApiTelegramException
+
+from pvpc_bot.ree.utils import store_data, load_data
+from pvpc_bot.ree.price_analyzer import chart_cache
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.bot.utils.metrics import metrics
+from pvpc_bot.config import FILE_IDS_FILE
+
+
+class FileIdCache:
+    def __init__(self, file_path: str=FILE_IDS_FILE):
+        self.file_path = file_path
+        self._file_ids = load_data(file_path) if os.path.exists(file_path) else {}
+        # image path -> (mtime, size, content hash), files are only hashed again when they change
+        self._hashes = {}
+        self._mutex = threading.Lock()
+        # Snapshots are numbered, a save that finishes late never overwrites a newer one
+        self._version = 0
+        self._saved_version = 0
+        self._save_mutex = threading.Lock()
+
+    def _content_hash(self, image_path: str) -> str:
+        stat = os.stat(image_path)
+        cached = self._hashes.get(image_path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        with open(image_path, "rb") as f:
+            content_hash = hashlib.sha1(f.read()).hexdigest()
+        self._hashes[image_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+        return content_hash
+
+    def get(self, image_path: str) -> str:
+        content_hash = self._content_hash(image_path)
+        with self._mutex:
+            entry = self._file_ids.get(image_path)
+            if entry is None:
+                return None
+            if entry["hash"] != content_hash:
+                # The image was regenerated, the uploaded one is outdated
+                del self._file_ids[image_path]
+                return None
+            return entry["file_id"]
+
+    def put(self, image_path: str, file_id: str) -> None:
+        content_hash = self._content_hash(image_path)
+        with self._mutex:
+            self._file_ids[image_path] = {"hash": content_hash, "file_id": file_id}
+            self._save()
+
+    def _save(self) -> None:
+        # Called holding the mutex: the snapshot and its version are taken together
+        self._version += 1
+        threading.Thread(target=self._write, args=(self._version, dict(self._file_ids))).start()
+
+    def _write(self, version: int, file_ids: dict) -> None:
+        with self._save_mutex:
+            if version <= self._saved_version:
+                return
+            store_data(json_data=file_ids, file_path=self.file_path, wait=True)
+            self._saved_version = version
+
+    def invalidate(self, image_path: str) -> None:
+        with self._mutex:
+            if self._file_ids.pop(image_path, None) is not None:
+                self._save()
+
+
+file_id_cache = FileIdCache()
+# Evicted charts are rendered again under the same name, their file_ids would only grow the file
+chart_cache.add_listener(lambda image_path: file_id_cache.invalidate(image_path))
+def send_cached_photo(bot: 'telebot.TeleBot', chat_id: int, image_path: str, **kwargs) -> 'telebot.types.Message':
+    file_id = file_id_cache.get(image_path)
+    metrics.count("file_ids.misses" if file_id is None else "file_ids.hits")
+    if file_id is not None:
+        try:
+            return bot.send_photo(chat_id, file_id, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                raise
+            log("Cached file_id of '%s' rejected, uploading it again: %r", image_path, e, level="WARNING")
+            file_id_cache.invalidate(image_path)
+
+    with open(image_path, "rb") as f:
+        message = bot.send_photo(chat_id, f, **kwargs)
+    file_id_cache.put(image_path, message.photo[-1].file_id)
+    return message
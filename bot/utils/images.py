@@ -1,3 +1,6 @@
+import os
+import unicodedata
+
 from pvpc_bot.config import IMAGE_NAME_DATETIME_FORMAT, IMAGE_TITLE_DATETIME_FORMAT
 
 
@@ -30,8 +33,18 @@ def translate(input_string: str) -> str:
         return ' '.join([traductor.get(word, word) for word in input_string.split()])
 
 
-def get_image_name(date: 'datetime.datetime') -> str:
-    return date.strftime(IMAGE_NAME_DATETIME_FORMAT)
+def get_image_name(date: 'datetime.datetime', geolocation: str=None, version: str=None) -> str:
+    name = date.strftime(IMAGE_NAME_DATETIME_FORMAT)
+    if version is not None:
+        root, extension = os.path.splitext(name)
+        name = f"{root}_{version}{extension}"
+    if geolocation is None:
+        return name
+    return f"{get_geo_slug(geolocation)}_{name}"
+
+
+def get_geo_slug(geolocation: str) -> str:
+    return unicodedata.normalize("NFKD", geolocation).encode("ascii", "ignore").decode().lower()
 
 
 def get_image_title(date: 'datetime.datetime') -> str:
@@ -0,0 +1,119 @@
+import os
+import re
+import gzip
+import logging
+import threading
+import datetime as dt
+
+from pvpc_bot.ree.utils import store_data, load_data
+from pvpc_bot.config import LOGS_DIR, LOG_INDEX_FILE, LOG_EXPORT_CHUNK
+
+
+# First line of an entry, in both the text ("[2022-01-31 13:00:00,000] [INFO]") and the JSON lines format
+ENTRY_REGEX = re.compile(rb'(?:\[|\{"time": ")(\d{4}-\d{2}-\d{2}) [\d:,]+(?:\] \[|", "level": ")([A-Z]+)')
+
+
+class LogIndex:
+    # Byte offsets of every day in every log file: [first byte, byte after the last entry].
+    # Rotated files never change, the current one is only scanned from where it was left
+    def __init__(self, index_path: str=LOG_INDEX_FILE):
+        self.index_path = index_path
+        self.files = load_data(index_path) if os.path.exists(index_path) else {}
+        self._mutex = threading.Lock()
+
+    def get_days(self, file_path: str) -> dict:
+        with self._mutex:
+            stat = os.stat(file_path)
+            name = os.path.basename(file_path)
+            entry = self.files.get(name)
+            if entry is None or entry["inode"] != stat.st_ino or entry["size"] > stat.st_size:
+                entry = {"inode": stat.st_ino, "size": 0, "last_day": None, "days": {}}
+            if entry["size"] < stat.st_size:
+                self._scan(file_path, entry)
+                self.files[name] = entry
+                store_data(json_data=self.files, file_path=self.index_path, wait=True)
+            return entry["days"]
+
+    @staticmethod
+    def _scan(file_path: str, entry: dict) -> None:
+        offset = entry["size"]
+        days = entry["days"]
+        with open(file_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                # A line still being written is scanned again the next time
+                if not line.endswith(b"\n"):
+                    break
+                match = ENTRY_REGEX.match(line)
+                if match and match.group(1).decode() != entry["last_day"]:
+                    entry["last_day"] = match.group(1).decode()
+                    days.setdefault(entry["last_day"], [offset, offset])
+                offset += len(line)
+                if entry["last_day"] is not None:
+                    days[entry["last_day"]][1] = offset
+        entry["size"] = offset
+
+
+log_index = LogIndex()
+
+
+def get_log_files(log_type: str, logs_dir: str=LOGS_DIR) -> list:
+    # Rotated files in date order ("bot_logs.2022-01-31.log"), then the current one ("bot_logs.log")
+    regex = re.compile(rf"bot_{log_type}(\.(\d{{4}}-\d{{2}}-\d{{2}}))?\.log")
+    files = []
+    for log_file in os.listdir(logs_dir):
+        match = regex.fullmatch(log_file)
+        if match:
+            files.append((match.group(2) or "9999-99-99", os.path.join(logs_dir, log_file)))
+    return [file_path for _, file_path in sorted(files)]
+
+
+def parse_log_filters(arguments: 'list[str]') -> tuple:
+    # "all" | "DD/MM/YYYY" | "DD/MM/YYYY-DD/MM/YYYY", optionally followed by the minimum level
+    start_date = end_date = min_level = None
+    if arguments and arguments[0].lower() != "all":
+        start, _, end = arguments[0].partition("-")
+        start_date = dt.datetime.strptime(start, "%d/%m/%Y").date()
+        end_date = dt.datetime.strptime(end, "%d/%m/%Y").date() if end else start_date
+    if len(arguments) > 1:
+        min_level = logging.getLevelName(arguments[1].upper())
+        if not isinstance(min_level, int):
+            raise ValueError(f"Unknown log level '{arguments[1]}'")
+    return start_date, end_date, min_level
+
+
+def export_logs(log_type: str, output_path: str, start_date: 'dt.date'=None, end_date: 'dt.date'=None, min_level: int=None) -> int:
+    # Streamed file by file into a gzip file, the whole history is never held in memory
+    start_day = start_date.isoformat() if start_date else "0000-00-00"
+    end_day = end_date.isoformat() if end_date else "9999-99-99"
+    written = 0
+    with gzip.open(output_path, "wb") as output:
+        for file_path in get_log_files(log_type):
+            spans = [span for day, span in log_index.get_days(file_path).items() if start_day <= day <= end_day]
+            if not spans:
+                continue
+            start, end = min(span[0] for span in spans), max(span[1] for span in spans)
+            with open(file_path, "rb") as f:
+                f.seek(start)
+                if min_level is None:
+                    while start < end:
+                        chunk = f.read(min(LOG_EXPORT_CHUNK, end - start))
+                        if not chunk:
+                            break
+                        output.write(chunk)
+                        start += len(chunk)
+                        written += len(chunk)
+                    continue
+
+                keep = False
+                for line in f:
+                    if start >= end:
+                        break
+                    start += len(line)
+                    match = ENTRY_REGEX.match(line)
+                    if match:
+                        keep = logging.getLevelName(match.group(2).decode()) >= min_level
+                    if keep:
+                        output.write(line)
+                        written += len(line)
+    return written
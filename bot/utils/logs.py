@@ -1,8 +1,14 @@
 from telebot.types import Message, CallbackQuery
+import json
+import queue
+import atexit
+import random
 import logging
+import threading
 import logging.config
+from logging.handlers import QueueHandler, QueueListener
 
-from pvpc_bot.config import LOGGING_CONFIG
+from pvpc_bot.config import LOGGING_CONFIG, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_DEBUG_SAMPLE_RATE
 
 
 def _get_username(obj: 'Any[telebot.types.Message, telebot.types.CallbackQuery]') -> str:
@@ -27,28 +33,110 @@ def _get_info(obj: 'Any[telebot.types.Message, telebot.types.CallbackQuery]') ->
     return "COMMAND", command
 
 
+class LogMessage:
+    # Built by the listener thread: neither the text arguments nor the Telegram object are formatted by the caller
+    __slots__ = ("text", "args", "obj")
+
+    def __init__(self, text: str, args: tuple, obj: 'Any[telebot.types.Message, telebot.types.CallbackQuery]'):
+        self.text = text
+        self.args = args
+        self.obj = obj
+
+    def fields(self) -> dict:
+        fields = {}
+        if self.obj is not None:
+            message_type, message_data = _get_info(self.obj)
+            fields.update({
+                "user_id": _get_user_id(self.obj),
+                "username": _get_username(self.obj),
+                "type": message_type,
+                "data": message_data
+            })
+        if self.text:
+            fields["text"] = self.text % self.args if self.args else self.text
+        if self.obj is not None:
+            fields["object"] = str(self.obj)
+        return fields
+
+    def __str__(self) -> str:
+        fields = self.fields()
+        log_text = ""
+        if self.obj is not None:
+            log_text += f"[ID: {fields['user_id']}] [USERNAME: {fields['username']}] [{fields['type']}: {fields['data']}]"
+        if self.text:
+            log_text += f"\n{fields['text']}"
+        if self.obj is not None:
+            log_text += f"\n{fields['object']}"
+        return log_text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: 'logging.LogRecord') -> str:
+        entry = {"time": self.formatTime(record), "level": record.levelname}
+        if isinstance(record.msg, LogMessage):
+            entry.update(record.msg.fields())
+        else:
+            entry["text"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyQueueHandler(QueueHandler):
+    def __init__(self, log_queue: 'queue.Queue'):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: 'logging.LogRecord') -> 'logging.LogRecord':
+        # The default one formats the record here, in the caller thread. Listener and callers share the process
+        return record
+
+    def enqueue(self, record: 'logging.LogRecord') -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 def _get_logger() -> 'logging.Logger':
     logging.config.dictConfig(LOGGING_CONFIG)
     bot_logger = logging.getLogger('bot_base_logger')
     namer = lambda n: f"{n.replace('.log', '')}.log"
-    for handler in bot_logger.handlers:
+    file_handlers = list(bot_logger.handlers)
+    for handler in file_handlers:
         handler.namer = namer
+        if LOG_FORMAT == "json":
+            handler.setFormatter(JsonFormatter())
+        bot_logger.removeHandler(handler)
+
+    # The callers only enqueue the record, formatting and writing the files happen in the listener thread
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    bot_logger.addHandler(LazyQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *file_handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
     return bot_logger
 
 
-bot_logger = _get_logger()
-def log(text: str="", obj: 'Any[telebot.types.Message, telebot.types.CallbackQuery]'=None, level: str="DEBUG"):
-    log_text = ""
-    if obj is not None:
-        user_id = _get_user_id(obj)
-        username = _get_username(obj)
-        message_type, message_data = _get_info(obj)
-        log_text += f"[ID: {user_id}] [USERNAME: {username}] [{message_type}: {message_data}]"
-    
-    if text:
-        log_text += f"\n{text}"
-    
-    if obj is not None:
-        log_text += f"\n{obj}"
-
-    bot_logger.log(level=getattr(logging, level), msg=log_text)
+_bot_logger = None
+_bot_logger_mutex = threading.Lock()
+def get_logger() -> 'logging.Logger':
+    # Configured on the first log, importing this module does not touch the log files
+    global _bot_logger
+    if _bot_logger is None:
+        with _bot_logger_mutex:
+            if _bot_logger is None:
+                _bot_logger = _get_logger()
+    return _bot_logger
+
+
+def log(text: str="", *args, obj: 'Any[telebot.types.Message, telebot.types.CallbackQuery]'=None, level: str="DEBUG"):
+    bot_logger = get_logger()
+    levelno = getattr(logging, level)
+    if not bot_logger.isEnabledFor(levelno):
+        return
+    # High volume events (every message, every delivery) are only kept for a fraction of them
+    if levelno == logging.DEBUG and LOG_DEBUG_SAMPLE_RATE < 1 and random.random() >= LOG_DEBUG_SAMPLE_RATE:
+        return
+
+    bot_logger.log(level=levelno, msg=LogMessage(text, args, obj))
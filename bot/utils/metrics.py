@@ -0,0 +1,155 @@
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pvpc_bot.config import METRICS_BUCKETS, METRICS_HOST, METRICS_PORT
+
+
+class Histogram:
+    # Fixed buckets: recording is a bisect and an increment, percentiles are estimated from the bucket bounds
+    def __init__(self, buckets: 'Sequence[float]'=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self._mutex = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        index = bisect_left(self.buckets, seconds)
+        with self._mutex:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, percentile: int) -> float:
+        with self._mutex:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0
+        rank, seen = count * percentile / 100, 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> tuple:
+        with self._mutex:
+            return list(self.counts), self.count, self.total
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        # name -> callable returning {metric: value}, read only when the metrics are exposed (cache stats...)
+        self.collectors = {}
+        self._mutex = threading.Lock()
+
+    def histogram(self, stage: str) -> 'Histogram':
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._mutex:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.histogram(stage).add(seconds)
+
+    def count(self, counter: str, value: int=1) -> None:
+        with self._mutex:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.count(f"{stage}.errors")
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str) -> 'Callable':
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_collector(self, name: str, collector: 'Callable[[], dict]') -> None:
+        self.collectors[name] = collector
+
+    def collect(self) -> dict:
+        values = {}
+        for name, collector in list(self.collectors.items()):
+            for metric, value in collector().items():
+                if isinstance(value, (int, float)):
+                    values[f"{name}.{metric}"] = value
+        return values
+
+    def get_stats(self) -> str:
+        lines = [f"{'stage':<28}{'n':>7}{'p50':>9}{'p99':>9}{'err':>5}"]
+        for stage, histogram in sorted(self.histograms.items()):
+            lines.append(
+                f"{stage:<28}{histogram.count:>7}{_milliseconds(histogram.percentile(50)):>9}"
+                f"{_milliseconds(histogram.percentile(99)):>9}{self.counters.get(f'{stage}.errors', 0):>5}"
+            )
+        lines.append("")
+        lines.extend(f"{counter}: {value}" for counter, value in sorted(self.counters.items()) if not counter.endswith(".errors"))
+        lines.extend(f"{metric}: {round(value, 3)}" for metric, value in sorted(self.collect().items()))
+        return "\n".join(lines)
+
+    def get_prometheus(self) -> str:
+        lines = ["# TYPE pvpc_stage_seconds histogram"]
+        for stage, histogram in sorted(self.histograms.items()):
+            counts, count, total = histogram.snapshot()
+            cumulative = 0
+            for bucket, bucket_count in zip(histogram.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'pvpc_stage_seconds_bucket{{stage="{stage}",le="{bucket}"}} {cumulative}')
+            lines.append(f'pvpc_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'pvpc_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines.append("# TYPE pvpc_events_total counter")
+        for counter, value in sorted(self.counters.items()):
+            lines.append(f'pvpc_events_total{{event="{counter}"}} {value}')
+        lines.append("# TYPE pvpc_collected gauge")
+        for metric, value in sorted(self.collect().items()):
+            lines.append(f'pvpc_collected{{metric="{metric}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _milliseconds(seconds: float) -> str:
+    return "inf" if seconds == float("inf") else f"{seconds * 1000:.0f}ms"
+
+
+metrics = Metrics()
+
+
+def start_metrics_server(host: str=METRICS_HOST, port: int=METRICS_PORT) -> 'ThreadingHTTPServer':
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = metrics.get_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    return httpd
@@ -0,0 +1,122 @@
+import json
+import hmac
+import time
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot.types import Update
+
+from pvpc_bot.ree.utils import LatencyStats
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.bot.utils.metrics import metrics
+from pvpc_bot.config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS, WEBHOOK_MAX_BODY
+)
+
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, bot: 'Any[telebot.TeleBot, SyncBridge]', host: str=WEBHOOK_HOST, port: int=WEBHOOK_PORT,
+                 path: str=WEBHOOK_PATH, secret_token: str=WEBHOOK_SECRET, queue_size: int=WEBHOOK_QUEUE_SIZE,
+                 workers: int=WEBHOOK_WORKERS):
+        self.bot = bot
+        if getattr(bot, "threaded", False):
+            # process_new_updates would only hand the update over to TeleBot's unbounded queue
+            log(text="The webhook bot is threaded, its queue and workers limits will not apply.", level="WARNING")
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+
+        # Bounded: when the handlers fall behind Telegram gets a 503 and retries the update later
+        self.updates = queue.Queue(maxsize=queue_size)
+        self.latency = LatencyStats()
+        self.received = 0
+        self.rejected = 0
+        self._mutex = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._request_handler())
+        self.httpd.daemon_threads = True
+
+    def _request_handler(self) -> type:
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404)
+                if server.secret_token and not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), server.secret_token):
+                    return self._reply(403)
+                length = int(self.headers.get("Content-Length", 0))
+                if not 0 < length <= WEBHOOK_MAX_BODY:
+                    return self._reply(413 if length else 400)
+                body = self.rfile.read(length)
+                self._reply(200 if server.enqueue(body) else 503)
+
+            def do_GET(self):
+                if self.path != f"{server.path}/stats":
+                    return self._reply(404)
+                self._reply(200, json.dumps(server.get_stats()).encode("utf-8"))
+
+            def _reply(self, status: int, body: bytes=b""):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                if body:
+                    self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+    def enqueue(self, body: bytes) -> bool:
+        try:
+            self.updates.put_nowait((time.monotonic(), body))
+        except queue.Full:
+            with self._mutex:
+                self.rejected += 1
+            return False
+        with self._mutex:
+            self.received += 1
+        return True
+
+    def _worker(self) -> None:
+        while True:
+            received, body = self.updates.get()
+            try:
+                update = Update.de_json(body.decode("utf-8"))
+                self.latency.add(time.monotonic() - received)
+                metrics.observe("webhook.dispatch", time.monotonic() - received)
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                log("Could not process the webhook update: %r", e, level="ERROR")
+            finally:
+                self.updates.task_done()
+
+    def get_stats(self) -> dict:
+        with self._mutex:
+            received, rejected = self.received, self.rejected
+        return {
+            "received": received,
+            "rejected": rejected,
+            "queued": self.updates.qsize(),
+            "dispatch_latency": self.latency.summary()
+        }
+
+    def serve_forever(self, url: str=WEBHOOK_URL) -> None:
+        # SyncBridge: without polling its event loop has to be started here
+        if hasattr(self.bot, "start_loop"):
+            self.bot.start_loop()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"webhook_{i}", daemon=True).start()
+        if url:
+            self.bot.set_webhook(url=url, secret_token=self.secret_token or None)
+        log("Listening for webhook updates on %s %s.", self.httpd.server_address, self.path, level="INFO")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
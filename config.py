@@ -6,20 +6,44 @@ HOME = "."
 DATA_DIR = os.path.join(HOME, "data")
 CACHE_DIR = os.path.join(DATA_DIR, "cache")
 IMAGE_DIR = os.path.join(CACHE_DIR, "graphs")
+PRICE_STORE_DIR = os.path.join(CACHE_DIR, "store")
 SETTINGS_DIR = os.path.join(DATA_DIR, "settings")
 LOGS_DIR = os.path.join(DATA_DIR, "logs")
 TMP_DIR = os.path.join(DATA_DIR, "tmp")
 TASKS_PATH = os.path.join(HOME, "tasks")
 TASKS_FILE = os.path.join(TASKS_PATH, "tasks.yaml")
+FILE_IDS_FILE = os.path.join(CACHE_DIR, "file_ids.json")
+SETTINGS_DB = os.path.join(SETTINGS_DIR, "settings.db")
+ROLLUPS_DB = os.path.join(CACHE_DIR, "rollups.db")
 
 
 # API Config
 API_TOKEN = ""
 BASE_API = "https://api.esios.ree.es"
-PRICES_URL = f"{BASE_API}/indicators/1001"
-SECTIONS_URL = f"{BASE_API}/indicators/1002"
+PRICES_INDICATOR = 1001
+SECTIONS_INDICATOR = 1002
 API_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# ESIOS datetimes are local to this timezone, whatever the geolocation
+API_TIMEZONE = "Europe/Madrid"
+API_POOL_SIZE = 10
+API_CONNECT_TIMEOUT = 3.05
+API_READ_TIMEOUT = 15
+API_RETRIES = 3
+API_BACKOFF = 0.5
+# Longer Retry-After waits are not honoured, the request fails instead
+API_MAX_RETRY_AFTER = 30
 DEFAULT_GEOLOCATION = "Península"
+BACKFILL_CHUNK_DAYS = 31
+# REE publishes the prices of the next day around this time, unpublished days are not requested before it
+PUBLICATION_TIME = (20, 15)
+UNPUBLISHED_RETRY = 300
+UNPUBLISHED_MAX_TTL = 6 * 3600
+BACKFILL_WORKERS = 4
+GEOLOCATIONS = ("Península", "Baleares", "Canarias", "Ceuta", "Melilla")
+# Rewritten days leave their previous rows behind, a column is compacted once they are this share of it
+# and at least this many rows, small columns would be rewritten on almost every write otherwise
+PRICE_STORE_MAX_DEAD_RATIO = 0.25
+PRICE_STORE_MIN_DEAD_ROWS = 4096
 
 
 # Data Config
@@ -28,19 +52,62 @@ LOW_PERCENTILE = 25
 HIGH_PERCENTILE = 70
 ROUND_DECIMALS = 5
 SECTION_DATA = [("high", 1), ("mid", 2), ("low", 3)]
+DAY_CACHE_SIZE = 64
+REPORT_CACHE_SIZE = 256
+LAPSE_TOP_K = 10
+LAPSE_NON_OVERLAPPING = True
+HISTORY_PERIODS = {"semana": 7, "mes": 30, "año": 365}
+HISTORY_DEFAULT_PERIOD = "mes"
+ALERTS_PER_USER = 5
+ALERT_MAX_WINDOW = 12
 
 # Data Config: Image Config
 IMAGE_NAME_DATETIME_FORMAT = "%Y%m%d.png"
 IMAGE_TITLE_DATETIME_FORMAT = "%A %-d of %B of %Y"
 IMAGE_X_LABEL = 'Tiempo (horas)'
 IMAGE_Y_LABEL = 'Precio (€/kWh)'
+COLOR_SCHEMES = ("percentiles", "sections")
+RENDER_WORKERS = 4
+
+# Cache Config: the least recently used files go first once a directory is over its size, None for no limit
+CHART_CACHE_MAX_BYTES = 256 * 2**20
+CHART_CACHE_MAX_AGE = 30 * 24 * 3600
+# JSON documents of previous versions, only removed once they are in the price store
+DOCUMENT_CACHE_MAX_BYTES = None
+DOCUMENT_CACHE_MAX_AGE = 7 * 24 * 3600
+CACHE_EVICTION_INTERVAL = 600
+
+# Settings Config: "sqlite" or "json" (one file per user)
+SETTINGS_BACKEND = "sqlite"
+SETTINGS_FLUSH_INTERVAL = 0.5
 
 # Bot Config
 BOT_TOKEN = ""
+# "sync" runs the handlers in the TeleBot threads, "async" talks to Telegram from an event loop
+BOT_MODE = "sync"
+BOT_WORKERS = 16
+# "polling" or "webhook", the webhook is served by an embedded HTTP server behind the TLS proxy
+BOT_UPDATES = "polling"
+WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_URL = ""
+WEBHOOK_SECRET = ""
+WEBHOOK_QUEUE_SIZE = 1000
+WEBHOOK_WORKERS = 8
+WEBHOOK_MAX_BODY = 1024 * 1024
+# Prometheus text endpoint on /metrics, disabled when None
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = None
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
 ADMIN_ENABLED = True
-ADMIN_COMMANDS = {"/users", "/logs", "/errors", "/op", "/deop"}
+ADMIN_COMMANDS = {"/users", "/logs", "/errors", "/op", "/deop", "/stats"}
 ADMINS = {}
 USERNAME_BOT = "@"
+DELIVERY_WORKERS = 32
+DELIVERY_GLOBAL_RATE = 30
+DELIVERY_CHAT_RATE = 1
+DELIVERY_MAX_RETRIES = 3
 WELCOME_STICKER = "CAACAgIAAxkBAAIZtmG7xqAThaURsQfRbA2WBsheCoBKAAJaDwACwWSJS2gGfUBK_uGIIwQ"
 WELCOME_MESSAGE = f"""
     👋 Bienvenido a {USERNAME_BOT} !!
@@ -76,10 +143,29 @@ HELP_MESSAGE = """
         ℹ Si quieres calcular los tramos de X horas seguidas que son más baratos a lo largo del día puedes poner <i>/analisis X</i>
 
         ℹ Puedes combinar ambas opciones y poner <i>/analisis X DD/MM/AAAA</i> o <i>/analisis DD/MM/AAAA X</i> para saber los conjuntos de X horas más baratas del dia seleccionado.
+
+    📈 <i>/historico</i>
+        Resumen estadístico del último mes, junto con una gráfica de la evolución de los precios.
+
+        ℹ Puedes elegir el periodo con <i>/historico semana</i>, <i>/historico mes</i> o <i>/historico año</i>, y el día en el que termina con <i>/historico mes DD/MM/AAAA</i>
+
+    🔔 <i>/alertas</i>
+        Muestra tus alertas, se comprueban en cuanto se publican los precios del día siguiente.
+
+        ℹ Con <i>/alertas precio X</i> te avisamos de las horas por debajo de X €/kWh, por ejemplo <i>/alertas precio 0.12</i>
+
+        ℹ Con <i>/alertas ventana X</i> te avisamos de las X horas seguidas más baratas, y con <i>/alertas borrar</i> las eliminas todas
     """
 
 LOG_FILE_NAME = "bot_logs.log"
 LOG_ERROR_FILE_NAME = "bot_errors.log"
+LOG_INDEX_FILE = os.path.join(LOGS_DIR, "log_index.json")
+LOG_EXPORT_CHUNK = 1024 * 1024
+# "text" writes the classic blocks, "json" one JSON object per line
+LOG_FORMAT = "text"
+LOG_QUEUE_SIZE = 10000
+# Fraction of the DEBUG events that are kept, they are logged for every message
+LOG_DEBUG_SAMPLE_RATE = 1.0
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': True,
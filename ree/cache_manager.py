@@ -0,0 +1,144 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.bot.utils.metrics import metrics
+from pvpc_bot.config import CACHE_EVICTION_INTERVAL
+
+
+class CacheManager:
+    # Every manager evicts from the same background thread
+    managers = []
+
+    def __init__(self, name: str, directory: str, pattern: str, max_bytes: int=None, max_age: float=None, can_evict: 'Callable[[str], bool]'=None):
+        self.name = name
+        self.directory = directory
+        self.pattern = re.compile(pattern)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.can_evict = can_evict
+        self.listeners = []
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        # path -> [size, last use], least recently used first. Other processes (prerender workers) write
+        # in the directory too, the index is synced with it before every eviction pass
+        self._files = OrderedDict()
+        self._scanned = False
+        self._mutex = threading.Lock()
+        self.managers.append(self)
+        metrics.add_collector(f"cache.{name}", self.stats)
+
+    def add_listener(self, listener: 'Callable[[str], None]') -> None:
+        # Called with the path of every evicted file
+        self.listeners.append(listener)
+
+    def get(self, file_path: str) -> bool:
+        exists = os.path.exists(file_path)
+        with self._mutex:
+            if exists:
+                self.hits += 1
+                if file_path in self._files:
+                    self._files[file_path][1] = time.time()
+                    self._files.move_to_end(file_path)
+            else:
+                self.misses += 1
+                self._files.pop(file_path, None)
+        return exists
+
+    def put(self, file_path: str) -> None:
+        size = os.path.getsize(file_path)
+        with self._mutex:
+            self._files[file_path] = [size, time.time()]
+            self._files.move_to_end(file_path)
+
+    def _scan(self) -> None:
+        entries = []
+        try:
+            with os.scandir(self.directory) as directory:
+                for entry in directory:
+                    if entry.is_file() and self.pattern.fullmatch(entry.name):
+                        stat = entry.stat()
+                        entries.append((entry.path, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            pass
+
+        with self._mutex:
+            files = {path: [size, mtime] for path, size, mtime in entries}
+            for path, (size, last_used) in self._files.items():
+                if path in files:
+                    files[path][1] = max(files[path][1], last_used)
+            self._files = OrderedDict(sorted(files.items(), key=lambda item: item[1][1]))
+            self._scanned = True
+
+    def evict(self) -> list:
+        self._scan()
+        now = time.time()
+        with self._mutex:
+            total = sum(size for size, _ in self._files.values())
+            victims = []
+            for path, (size, last_used) in self._files.items():
+                expired = self.max_age is not None and now - last_used > self.max_age
+                if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                    break
+                if self.can_evict is None or self.can_evict(path):
+                    victims.append((path, size))
+                    total -= size
+            for path, _ in victims:
+                del self._files[path]
+
+        evicted = []
+        for path, size in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            evicted.append(path)
+            with self._mutex:
+                self.evictions += 1
+                self.evicted_bytes += size
+            for listener in self.listeners:
+                listener(path)
+        if evicted:
+            log("Evicted %s files from the %s cache.", len(evicted), self.name, level="INFO")
+        return evicted
+
+    def stats(self) -> dict:
+        with self._mutex:
+            total = self.hits + self.misses
+            return {
+                "files": len(self._files) if self._scanned else None,
+                "bytes": sum(size for size, _ in self._files.values()) if self._scanned else None,
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes
+            }
+
+
+_eviction_thread = None
+_eviction_mutex = threading.Lock()
+def enable_eviction(interval: float=CACHE_EVICTION_INTERVAL) -> None:
+    global _eviction_thread
+
+    def evict_forever():
+        while True:
+            for manager in list(CacheManager.managers):
+                try:
+                    manager.evict()
+                except Exception as e:
+                    log("Could not evict the %s cache: %r", manager.name, e, level="ERROR")
+            time.sleep(interval)
+
+    with _eviction_mutex:
+        if _eviction_thread is None:
+            _eviction_thread = threading.Thread(target=evict_forever, daemon=True)
+            _eviction_thread.start()
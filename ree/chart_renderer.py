@@ -0,0 +1,90 @@
+import threading
+
+from pvpc_bot.bot.utils.images import get_image_legend, get_image_title
+from pvpc_bot.bot.utils.sections import get_color_info
+from pvpc_bot.config import SECTION_DATA, IMAGE_X_LABEL, IMAGE_Y_LABEL
+
+
+FONT = {'family': 'monospace', 'variant': 'small-caps', 'style': 'italic'}
+
+
+def new_figure() -> 'matplotlib.figure.Figure':
+    # A figure with its own Agg canvas: no pyplot global state, safe to use from any thread.
+    # matplotlib is only imported with the first chart
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    return figure
+
+
+class ChartRenderer:
+    # The day chart template: axes, labels, fonts and every artist are built once, each chart only swaps their data
+    def __init__(self):
+        self.figure = new_figure()
+        self.axes = self.figure.add_subplot()
+        self.axes.set_xlabel(IMAGE_X_LABEL, fontdict={**FONT, 'size': 10})
+        self.axes.set_ylabel(IMAGE_Y_LABEL, fontdict={**FONT, 'size': 10, 'verticalalignment': 'baseline'})
+        self.title = self.axes.set_title("", fontdict={**FONT, 'size': 15})
+
+        self.percentile_lines = {
+            percentile: self.axes.plot([], [], color="black", linestyle=':')[0]
+            for percentile in ("low_percentile", "high_percentile")
+        }
+        self.price_line, = self.axes.plot([], [], color='black', linestyle='-.', linewidth=2, marker='')
+        self.section_markers = {
+            section: self.axes.plot(
+                [], [],
+                color='black',
+                linestyle='',
+                marker='o',
+                markerfacecolor=get_color_info(section_id)[2],
+                markersize=7
+            )[0]
+            for section, section_id in SECTION_DATA
+        }
+        # (colors, sections drawn) -> legend, there are only a handful of them
+        self.legends = {}
+
+    def _legend(self, colors: str, sections: tuple) -> 'matplotlib.legend.Legend':
+        from matplotlib.legend import Legend
+
+        key = (colors, sections)
+        if key not in self.legends:
+            handles = [self.section_markers[section] for section in sections]
+            self.legends[key] = Legend(self.axes, handles, [get_image_legend(section, colors) for section in sections])
+        return self.legends[key]
+
+    def render(self, summary: 'DaySummary', colors: str, file_path: str) -> str:
+        time = range(len(summary.data))
+        prices = [price["price"] for price in summary.data]
+
+        for percentile, line in self.percentile_lines.items():
+            line.set_data(time, [getattr(summary, percentile)] * len(prices))
+        self.price_line.set_data(time, prices)
+
+        # Price data painted by hour sections
+        sections = []
+        for section, section_id in SECTION_DATA:
+            indexes = summary.get_indexes(colors)[section]
+            self.section_markers[section].set_data(indexes, [prices[i] for i in indexes])
+            self.section_markers[section].set_visible(bool(indexes))
+            if indexes:
+                sections.append(section)
+
+        self.title.set_text(get_image_title(summary.day))
+        self.axes.legend_ = self._legend(colors, tuple(sections))
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.figure.savefig(file_path, format="png")
+        return file_path
+
+
+_renderers = threading.local()
+def get_chart_renderer() -> 'ChartRenderer':
+    # One template per thread, a figure can not be drawn by two threads at once
+    renderer = getattr(_renderers, "renderer", None)
+    if renderer is None:
+        renderer = _renderers.renderer = ChartRenderer()
+    return renderer
@@ -0,0 +1,29 @@
+import heapq
+from itertools import accumulate
+
+
+def cheapest_windows(prices: 'Sequence[float]', length: int, top_k: int=None, non_overlapping: bool=False) -> 'list[tuple[float, int]]':
+    if length <= 0 or length > len(prices):
+        return []
+
+    # Prefix sums: the sum of any window is a single subtraction, O(n) for all of them
+    sums = list(accumulate(prices, initial=0))
+    windows = [(sums[start + length] - sums[start], start) for start in range(len(prices) - length + 1)]
+
+    if not non_overlapping:
+        return heapq.nsmallest(top_k, windows) if top_k is not None else sorted(windows)
+
+    # Greedy from the cheapest, skipping windows that share any point with an already chosen one.
+    # Choosing a window blocks the starts of every window overlapping it, so each candidate is checked
+    # in O(1) and the blocks add up to O(n): O(n) for the heap plus O(log n) per candidate popped
+    heapq.heapify(windows)
+    blocked = bytearray(len(windows))
+    chosen = []
+    while windows and (top_k is None or len(chosen) < top_k):
+        total, start = heapq.heappop(windows)
+        if blocked[start]:
+            continue
+        low, high = max(start - length + 1, 0), min(start + length, len(blocked))
+        blocked[low:high] = b"\x01" * (high - low)
+        chosen.append((total, start))
+    return chosen
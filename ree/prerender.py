@@ -0,0 +1,69 @@
+import time
+import threading
+import multiprocessing
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pvpc_bot.ree.ree_api import ReeCache, DocumentNotFound
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.config import GEOLOCATIONS, COLOR_SCHEMES, RENDER_WORKERS
+
+
+def _render_chart(date: 'dt.datetime', geolocation: str, colors: str) -> tuple:
+    from pvpc_bot.ree.price_analyzer import PriceAnalyzer
+
+    start = time.perf_counter()
+    file_path = PriceAnalyzer(date, geolocation=geolocation).generate_png(colors=colors)
+    return geolocation, colors, file_path, time.perf_counter() - start
+
+
+def _day_versions(date: 'dt.datetime') -> tuple:
+    from pvpc_bot.ree.price_analyzer import PriceAnalyzer
+
+    versions = []
+    for geolocation in GEOLOCATIONS:
+        try:
+            versions.append(PriceAnalyzer(date, geolocation=geolocation).get_summary().version)
+        except DocumentNotFound:
+            versions.append(None)
+    return tuple(versions)
+
+
+# (day, data version of every geolocation): a day published again by ESIOS is rendered again
+_prerendered_days = set()
+_prerender_mutex = threading.Lock()
+def prerender_day(date: 'dt.datetime', max_workers: int=RENDER_WORKERS, force: bool=False) -> list:
+    key = (date, _day_versions(date))
+    with _prerender_mutex:
+        if key in _prerendered_days and not force:
+            return []
+        _prerendered_days.add(key)
+
+    log("Prerendering the charts for day %s.", date, level="INFO")
+    start = time.perf_counter()
+    renders = []
+    # Spawned workers do not inherit the locks held by the bot threads (logging, telebot...)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {
+            executor.submit(_render_chart, date, geolocation, colors): (geolocation, colors)
+            for geolocation in GEOLOCATIONS
+            for colors in COLOR_SCHEMES
+        }
+        for future in as_completed(futures):
+            try:
+                geolocation, colors, file_path, elapsed = future.result()
+                log("Prerendered '%s' (%s, %s) in %.3fs.", file_path, geolocation, colors, elapsed, level="INFO")
+                renders.append({"geolocation": geolocation, "colors": colors, "file": file_path, "seconds": elapsed})
+            except Exception as e:
+                log("Could not prerender the chart %s for day %s: %r", futures[future], date, e, level="ERROR")
+
+    log("Prerendered %s charts for day %s in %.3fs.", len(renders), date, time.perf_counter() - start, level="INFO")
+    return renders
+
+
+def enable_prerender() -> None:
+    def on_day_ready(date):
+        # Only the upcoming days are worth rendering for everyone
+        if multiprocessing.parent_process() is None and date.date() >= dt.date.today():
+            threading.Thread(target=prerender_day, args=(date,), daemon=True).start()
+    ReeCache.add_day_listener(on_day_ready)
@@ -1,23 +1,33 @@
 import os
-import math
+import threading
 import datetime as dt
-from platform import platform
 
-import matplotlib
-import matplotlib.pyplot as plt
-
-from pvpc_bot.ree.ree_api import ReeAPI
-from pvpc_bot.bot.utils.images import get_image_legend, get_image_name, get_image_title
-from pvpc_bot.bot.utils.sections import get_section, get_color_info
+from pvpc_bot.ree.ree_api import ReeAPI, ReeCache
+from pvpc_bot.ree.utils import LRUCache, SingleFlight
+from pvpc_bot.ree.cache_manager import CacheManager
+from pvpc_bot.ree.chart_renderer import get_chart_renderer
+from pvpc_bot.ree.price_store import align_sections
+from pvpc_bot.ree.summary import DaySummary
+from pvpc_bot.bot.utils.images import get_image_name
 from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.bot.utils.metrics import metrics
 from pvpc_bot.config import (
-    DEFAULT_GEOLOCATION, DATETIME_FORMAT, ROUND_DECIMALS, LOW_PERCENTILE, HIGH_PERCENTILE, SECTION_DATA,
-    IMAGE_DIR, IMAGE_X_LABEL, IMAGE_Y_LABEL
+    DEFAULT_GEOLOCATION, SECTION_DATA, IMAGE_DIR, DAY_CACHE_SIZE, CHART_CACHE_MAX_BYTES, CHART_CACHE_MAX_AGE
 )
 
 
-if "macos" in platform().lower():
-    matplotlib.use('Agg')
+# Summaries of the most requested (day, geolocation) pairs
+day_cache = LRUCache(DAY_CACHE_SIZE)
+ReeCache.add_listener(lambda method, date: day_cache.invalidate(lambda key: key[0] == date.date()))
+
+# Day and history charts, outdated versions are never requested again and age out
+chart_cache = CacheManager("charts", IMAGE_DIR, r".+\.png", max_bytes=CHART_CACHE_MAX_BYTES, max_age=CHART_CACHE_MAX_AGE)
+
+# Concurrent requests of a missing chart wait for a single render
+render_flight = SingleFlight()
+
+metrics.add_collector("day_cache", day_cache.stats)
+metrics.add_collector("render_flight", render_flight.stats)
 
 
 class PriceAnalyzer:
@@ -27,139 +37,70 @@ class PriceAnalyzer:
 
         self.datetime = date
         self.day = (self.datetime.year, self.datetime.month, self.datetime.day)
-        self.data = self._aggregate_data()
+        self.summary = day_cache.get_or_create(
+            (self.datetime.date(), self.geolocation),
+            self._build_summary
+        )
+        self.data = self.summary.data
     
-    def _aggregate_data(self) -> dict:
-        def get_geo_id(data):
-            for gid in data["indicator"]["geos"]:
-                if gid["geo_name"] == self.geolocation:
-                    return gid["geo_id"]
-        # Get raw data
-        prices = self.ree.get_prices(*self.day)
-        sections = self.ree.get_sections(*self.day)
-        geo_id = get_geo_id(prices)
-
-        # Generate sections dictionary
-        sections_dict = {
-            section["datetime"]: int(section["value"])
-            for section in sections["indicator"]["values"]
-            if section["geo_id"] == geo_id
-        }
+    @metrics.timed("analyzer.summary")
+    def _build_summary(self) -> 'DaySummary':
+        return DaySummary(dt.datetime(*self.day), self._aggregate_data())
+
+    def _aggregate_data(self) -> list:
+        # Raw columns straight from the price store
+        price_minutes, prices = self.ree.get_day_values("prices", self.geolocation, *self.day)
+        section_minutes, sections = self.ree.get_day_values("sections", self.geolocation, *self.day)
+
+        sections = align_sections(price_minutes, section_minutes, sections)
 
         # Generate the aggregated data
+        day = dt.datetime(*self.day)
         return [
             {
                 # Transform MWh to kWh
-                "price": price["value"] / 1000,
-                "datetime": dt.datetime.strptime(price["datetime"].split("+")[0], DATETIME_FORMAT),
-                "section": sections_dict[price["datetime"]]
+                "price": price / 1000,
+                "datetime": day + dt.timedelta(minutes=minutes),
+                "section": section
             }
-            for price in prices["indicator"]["values"]
-            if price["geo_id"] == geo_id 
+            for minutes, price, section in zip(price_minutes, prices, sections)
         ]
 
     def get_percentile(self, percentile: int) -> float:
-        index = math.ceil(len(self.data) * (percentile / 100))
-        sorted_data = sorted(self.data, key=lambda x: x['price'])
-        return round(sorted_data[index]['price'], 5)
-    
+        return self.summary.get_percentile(percentile)
+
     def get_mean(self, section: int=None) -> float:
-        lst_data = [x['price'] for x in self.data if section is None or x["section"] == section]
-        if lst_data:
-            mean = sum(lst_data)/len(lst_data)
-            return round(mean, ROUND_DECIMALS)
-        return 0
-
-    def get_summary(self) -> dict:
-        # Construct data
-        low_percentile = self.get_percentile(LOW_PERCENTILE)
-        high_percentile = self.get_percentile(HIGH_PERCENTILE)
-        return {
-            "day": dt.datetime(*self.day),
-            "mean": self.get_mean(),
-            "low_percentile": low_percentile,
-            "high_percentile": high_percentile,
-            "max": max(self.data, key=lambda x: x["price"]),
-            "min": min(self.data, key=lambda x: x["price"]),
-            "data": {
-                "sections": {
-                    **{
-                        section_name: {
-                            "color": get_color_info(section_id)[2],
-                            "mean": self.get_mean(section_id),
-                            "prices": [(i, price) for i, price in enumerate(self.data) if price["section"] == section_id]
-                        }
-                        for section_name, section_id in SECTION_DATA
-                    },
-                    "list": self.data
-                },
-                "percentiles": {
-                    **{
-                        section_name: {
-                            "color": get_color_info(section_id)[2],
-                            "prices": [(i, price) for i, price in enumerate(self.data) if get_section(price["price"], low_percentile, high_percentile) == section_id]
-                        }
-                        for section_name, section_id in SECTION_DATA
-                    },
-                    "list": [{**price, "percentile_section": get_section(price["price"], low_percentile, high_percentile)} for price in self.data]
-                }
-            }
-        }
-    
+        if section is None:
+            return self.summary.mean
+        section_names = {section_id: section_name for section_name, section_id in SECTION_DATA}
+        return self.summary.section_means[section_names[section]]
+
+    def get_summary(self) -> 'DaySummary':
+        return self.summary
+
     def generate_png(self, filename: str=None, colors="percentiles") -> str:
-        # Get the plot filename
+        # Get the plot filename, a new version of the day data is a new chart
         if filename is None:
-            filename = f"{colors}_{get_image_name(self.datetime)}"
+            filename = f"{colors}_{get_image_name(self.datetime, self.geolocation, self.summary.version)}"
         file_path = os.path.join(IMAGE_DIR, filename)
 
         # Do not create it again if it already exists
+        if chart_cache.get(file_path):
+            return file_path
+        return render_flight.do(file_path, lambda: self._render_png(file_path, colors))
+
+    @metrics.timed("analyzer.render")
+    def _render_png(self, file_path: str, colors: str) -> str:
         if os.path.exists(file_path):
             return file_path
-        
-        log(text=f"Gennerating the PNG file '{file_path}'.", level="INFO")
+
+        log("Gennerating the PNG file '%s'.", file_path, level="INFO")
         summary = self.get_summary()
+        log("Gennerating the PNG file '%s':\nlow=%s high=%s with %s values.", file_path, summary.low_percentile, summary.high_percentile, len(self.data))
 
-        # Timeline
-        time = [i for i in range(len(self.data))]
-
-        # Percentile lines
-        for p in ("low_percentile", "high_percentile"):
-            log(text=f"Gennerating the PNG file '{file_path}':\np_line={p} p_value={summary[p]}", level="INFO")
-            plt.plot(
-                time,
-                [summary[p] for _ in range(len(self.data))],
-                color="black",
-                linestyle=':'
-            )
-
-        # Electricity price evolution
-        log(text=f"Gennerating the PNG file '{file_path}':\nprinting line with {len(self.data)} values.", level="INFO")
-        log(text=f"self.data={self.data}", level="INFO")
-        plt.plot(time, [price["price"] for price in self.data], color='black', linestyle='-.', linewidth=2, marker='')
-        
-        # Price data painted by hour sections
-        plt_tramo = []
-        for section in summary["data"][colors]:
-            if section != "list" and summary["data"][colors][section]["prices"]:
-                log(text=f"Gennerating the PNG file '{file_path}':\nprinting color {section} with {len(summary['data'][colors][section]['prices'])} values.", level="INFO")
-                plt_data, = plt.plot(
-                    [t for t, _ in summary["data"][colors][section]["prices"]],
-                    [p["price"] for _, p in summary["data"][colors][section]["prices"]],
-                    color='black',
-                    linestyle='',
-                    marker='o',
-                    markerfacecolor=summary["data"][colors][section]["color"],
-                    markersize=7
-                )
-                plt_data.set_label(get_image_legend(section, colors))
-                plt_tramo.append(plt_data)
-        
-        # Asthetic
-        plt.xlabel(IMAGE_X_LABEL, fontdict={'family':'monospace', 'variant': 'small-caps', 'style': 'italic', 'size':10})
-        plt.ylabel(IMAGE_Y_LABEL, fontdict={'family':'monospace', 'variant': 'small-caps', 'style': 'italic', 'size':10, 'verticalalignment': 'baseline'})
-        plt.title(get_image_title(self.datetime), fontdict={'family':'monospace', 'variant': 'small-caps', 'style': 'italic', 'size':15})
-        plt.legend(handles=plt_tramo)
-
-        # Save the plot
-        plt.savefig(file_path)
+        # Save the plot, readers must never see a half written file
+        tmp_file_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        get_chart_renderer().render(summary, colors, tmp_file_path)
+        os.replace(tmp_file_path, file_path)
+        chart_cache.put(file_path)
         return file_path
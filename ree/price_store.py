@@ -0,0 +1,291 @@
+import os
+import json
+import mmap
+import fcntl
+import threading
+import datetime as dt
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from zoneinfo import ZoneInfo
+
+from pvpc_bot.ree.utils import load_data
+from pvpc_bot.config import API_TIMEZONE, PRICE_STORE_DIR, PRICE_STORE_MAX_DEAD_RATIO, PRICE_STORE_MIN_DEAD_ROWS
+
+
+# Day index positions are counted from this day, so looking a day up is a single array access
+STORE_EPOCH = dt.date(2000, 1, 1).toordinal()
+TYPECODES = {"prices": "d", "sections": "B"}
+
+
+def _minutes(api_datetime: str) -> int:
+    # "2022-01-31T13:00:00.000+01:00" -> minutes since the local midnight
+    return int(api_datetime[11:13]) * 60 + int(api_datetime[14:16])
+
+
+def _api_datetimes(date: 'dt.date', day_minutes: 'Sequence[int]') -> list:
+    # Only the local minutes are stored, the UTC offset is the one of the API timezone then.
+    # A time that does not come after the previous one is the repeated hour of the day DST ends
+    timezone = ZoneInfo(API_TIMEZONE)
+    datetimes, previous = [], -1
+    for minutes in day_minutes:
+        local = dt.datetime(date.year, date.month, date.day, minutes // 60, minutes % 60, tzinfo=timezone, fold=int(minutes <= previous))
+        offset = int(local.utcoffset().total_seconds()) // 60
+        sign = "+" if offset >= 0 else "-"
+        datetimes.append(f"{local:%Y-%m-%dT%H:%M}:00.000{sign}{abs(offset) // 60:02d}:{abs(offset) % 60:02d}")
+        previous = minutes
+    return datetimes
+
+
+def align_sections(price_minutes: 'Sequence[int]', section_minutes: 'Sequence[int]', sections: 'Sequence[int]') -> 'Sequence[int]':
+    # Sections are hourly, prices may have a finer resolution: take the section of the hour each price starts in
+    if len(sections) == len(price_minutes):
+        return sections
+    section_minutes = list(section_minutes)
+    return [sections[max(bisect_right(section_minutes, minutes) - 1, 0)] for minutes in price_minutes]
+
+
+class PriceColumn:
+    def __init__(self, root: str, method: str, geo_id: int):
+        base_path = os.path.join(root, f"{method}_{geo_id}")
+        self.values_path = f"{base_path}.values"
+        self.minutes_path = f"{base_path}.minutes"
+        self.index_path = f"{base_path}.index"
+        self.lock_path = f"{base_path}.lock"
+        self.typecode = TYPECODES[method]
+
+        # index[2 * day] = first row of the day, index[2 * day + 1] = number of rows (0 when missing).
+        # It is reloaded whenever the file changes, other processes (tasks, prerender workers) write too
+        self._index = array("I")
+        self._index_stat = None
+        self._maps = {}
+        self._mutex = threading.Lock()
+
+    def _refresh_index(self) -> None:
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) != self._index_stat:
+            index = array("I")
+            with open(self.index_path, "rb") as f:
+                index.frombytes(f.read())
+            self._index, self._index_stat = index, (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @contextmanager
+    def _reading(self):
+        # The index and the data maps are resolved under a shared lock, a write or a compaction of another
+        # process can not pair the rows of one version of the files with the index of another.
+        # Same order as the writers, the mutex first, so threads of this process can not deadlock
+        with self._mutex, open(self.lock_path, "ab") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            yield
+
+    def _locate(self, date: 'dt.date') -> tuple:
+        position = 2 * (date.toordinal() - STORE_EPOCH)
+        self._refresh_index()
+        if position + 1 >= len(self._index) or not self._index[position + 1]:
+            return None
+        return self._index[position], self._index[position + 1]
+
+    def locate(self, date: 'dt.date') -> tuple:
+        with self._reading():
+            return self._locate(date)
+
+    def _view(self, path: str, typecode: str, start: int, stop: int) -> memoryview:
+        itemsize = array(typecode).itemsize
+        inode, mapped = self._maps.get(path, (None, None))
+        stat = os.stat(path)
+        if mapped is None or inode != stat.st_ino or len(mapped) < stop * itemsize:
+            # Views handed out before keep the previous map alive, it is never closed explicitly
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = (stat.st_ino, mapped)
+        return memoryview(mapped)[start * itemsize:stop * itemsize].cast(typecode)
+
+    def read(self, date: 'dt.date') -> tuple:
+        with self._reading():
+            location = self._locate(date)
+            if location is None:
+                return None
+            offset, count = location
+            return (
+                self._view(self.minutes_path, "H", offset, offset + count),
+                self._view(self.values_path, self.typecode, offset, offset + count)
+            )
+
+    def read_range(self, start_date: 'dt.date', end_date: 'dt.date') -> tuple:
+        with self._reading():
+            return self._read_range(start_date, end_date)
+
+    def _read_range(self, start_date: 'dt.date', end_date: 'dt.date') -> tuple:
+        days = [start_date + dt.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        locations = [(day, self._locate(day)) for day in days]
+        locations = [(day, location) for day, location in locations if location is not None]
+        if not locations:
+            return [], array("H"), array(self.typecode)
+
+        # Days appended in order are contiguous: the whole range is a zero-copy slice
+        dates, start, expected = [], locations[0][1][0], locations[0][1][0]
+        contiguous = True
+        for day, (offset, count) in locations:
+            contiguous = contiguous and offset == expected
+            expected = offset + count
+            dates.append((day, count))
+        if contiguous:
+            return (
+                dates,
+                self._view(self.minutes_path, "H", start, expected),
+                self._view(self.values_path, self.typecode, start, expected)
+            )
+
+        minutes, values = array("H"), array(self.typecode)
+        for day, (offset, count) in locations:
+            minutes.extend(self._view(self.minutes_path, "H", offset, offset + count))
+            values.extend(self._view(self.values_path, self.typecode, offset, offset + count))
+        return dates, minutes, values
+
+    def _rows(self, path: str, typecode: str) -> int:
+        return os.path.getsize(path) // array(typecode).itemsize if os.path.exists(path) else 0
+
+    def write(self, date: 'dt.date', minutes: 'list[int]', values: 'list') -> None:
+        position = 2 * (date.toordinal() - STORE_EPOCH)
+        with self._mutex, open(self.lock_path, "wb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # A write interrupted between both files leaves one longer than the other:
+            # the rows past the shorter one were never indexed, they are dropped before appending
+            files = [(path, typecode, self._rows(path, typecode)) for path, typecode in ((self.minutes_path, "H"), (self.values_path, self.typecode))]
+            offset = min(rows for _, _, rows in files)
+            for path, typecode, rows in files:
+                if rows > offset:
+                    os.truncate(path, offset * array(typecode).itemsize)
+            # Rewritten days are appended too, the index just points to the new rows.
+            # Rows are never changed in place: views handed out before keep the previous version
+            with open(self.minutes_path, "ab") as f:
+                f.write(array("H", minutes).tobytes())
+            with open(self.values_path, "ab") as f:
+                f.write(array(self.typecode, values).tobytes())
+            with open(self.index_path, "r+b" if os.path.exists(self.index_path) else "wb") as f:
+                f.seek(position * array("I").itemsize)
+                f.write(array("I", [offset, len(values)]).tobytes())
+            self._index_stat = None
+
+            # Counting the live rows reads the whole index, pointless until there can be enough dead ones
+            rows = offset + len(values)
+            if rows >= PRICE_STORE_MIN_DEAD_ROWS:
+                self._refresh_index()
+                dead = rows - sum(self._index[1::2])
+                if dead >= PRICE_STORE_MIN_DEAD_ROWS and dead > rows * PRICE_STORE_MAX_DEAD_RATIO:
+                    self._compact()
+
+    def compact(self) -> None:
+        with self._mutex, open(self.lock_path, "wb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._compact()
+
+    def _compact(self) -> None:
+        # Rewrites the rows in date order, dropping the replaced ones, so every range becomes contiguous
+        self._refresh_index()
+        if not self._index:
+            return
+        minutes, values = array("H"), array(self.typecode)
+        old_minutes, old_values = array("H"), array(self.typecode)
+        with open(self.minutes_path, "rb") as f:
+            old_minutes.frombytes(f.read())
+        with open(self.values_path, "rb") as f:
+            old_values.frombytes(f.read())
+
+        index = array("I", self._index)
+        for position in range(0, len(index), 2):
+            offset, count = index[position], index[position + 1]
+            if count:
+                index[position] = len(values)
+                minutes.extend(old_minutes[offset:offset + count])
+                values.extend(old_values[offset:offset + count])
+
+        for path, data in ((self.minutes_path, minutes), (self.values_path, values), (self.index_path, index)):
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data.tobytes())
+            os.replace(f"{path}.tmp", path)
+        self._index_stat = None
+
+
+class PriceStore:
+    def __init__(self, root: str=PRICE_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.geos_path = os.path.join(root, "geos.json")
+        self.geos = load_data(self.geos_path) if os.path.exists(self.geos_path) else {}
+        self._columns = {}
+        self._mutex = threading.Lock()
+
+    def column(self, method: str, geolocation: str) -> 'PriceColumn':
+        key = (method, geolocation)
+        with self._mutex:
+            if key not in self._columns:
+                self._columns[key] = PriceColumn(self.root, method, self.geos[geolocation])
+            return self._columns[key]
+
+    def _register_geos(self, geos: list) -> None:
+        with self._mutex:
+            new_geos = {geo["geo_name"]: geo["geo_id"] for geo in geos if geo["geo_name"] not in self.geos}
+            if new_geos:
+                self.geos.update(new_geos)
+                with open(self.geos_path, "wt", encoding="utf-8") as f:
+                    f.write(json.dumps(self.geos, ensure_ascii=False))
+
+    def put_document(self, data: dict, method: str, date: 'dt.datetime') -> None:
+        self._register_geos(data["indicator"]["geos"])
+        rows = {}
+        for value in data["indicator"]["values"]:
+            minutes, values = rows.setdefault(value["geo_name"], ([], []))
+            minutes.append(_minutes(value["datetime"]))
+            values.append(value["value"] if method == "prices" else int(value["value"]))
+        for geolocation, (minutes, values) in rows.items():
+            self.column(method, geolocation).write(date, minutes, values)
+
+    def has_day(self, method: str, date: 'dt.datetime') -> bool:
+        return any(self.column(method, geolocation).locate(date) is not None for geolocation in list(self.geos))
+
+    def get_day(self, method: str, geolocation: str, date: 'dt.datetime') -> tuple:
+        if geolocation not in self.geos:
+            return None
+        return self.column(method, geolocation).read(date)
+
+    def get_range(self, method: str, geolocation: str, start_date: 'dt.datetime', end_date: 'dt.datetime') -> tuple:
+        return self.column(method, geolocation).read_range(start_date, end_date)
+
+    def compact(self) -> None:
+        for method in TYPECODES:
+            for geolocation in list(self.geos):
+                self.column(method, geolocation).compact()
+
+    def get_document(self, method: str, date: 'dt.datetime') -> dict:
+        # Same shape as the ESIOS response, for the callers that still need the whole document
+        geos, values = [], []
+        for geolocation, geo_id in list(self.geos.items()):
+            day = self.get_day(method, geolocation, date)
+            if day is None:
+                continue
+            geos.append({"geo_id": geo_id, "geo_name": geolocation})
+            day_minutes, day_values = day
+            values.extend(
+                {
+                    "value": value,
+                    "datetime": datetime,
+                    "geo_id": geo_id,
+                    "geo_name": geolocation
+                }
+                for datetime, value in zip(_api_datetimes(date, day_minutes), day_values)
+            )
+        return {"indicator": {"geos": geos, "values": values}}
+
+
+_price_store = None
+_price_store_mutex = threading.Lock()
+def get_price_store() -> 'PriceStore':
+    global _price_store
+    with _price_store_mutex:
+        if _price_store is None:
+            _price_store = PriceStore()
+        return _price_store
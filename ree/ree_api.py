@@ -1,11 +1,23 @@
 import os
-import json
+import time
+import random
+import threading
 import requests
 import datetime as dt
 from json.decoder import JSONDecodeError
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-from pvpc_bot.ree.utils import store_data
-from pvpc_bot.config import API_TOKEN, PRICES_URL, SECTIONS_URL, API_DATETIME_FORMAT, CACHE_DIR
+from pvpc_bot.ree.utils import load_data, LRUCache, LatencyStats, SingleFlight
+from pvpc_bot.ree.price_store import get_price_store
+from pvpc_bot.ree.cache_manager import CacheManager
+from pvpc_bot.bot.utils.metrics import metrics
+from pvpc_bot.config import (
+    API_TOKEN, BASE_API, PRICES_INDICATOR, SECTIONS_INDICATOR, API_DATETIME_FORMAT, CACHE_DIR,
+    BACKFILL_CHUNK_DAYS, BACKFILL_WORKERS, PUBLICATION_TIME, UNPUBLISHED_RETRY, UNPUBLISHED_MAX_TTL, DOCUMENT_CACHE_MAX_BYTES, DOCUMENT_CACHE_MAX_AGE,
+    API_POOL_SIZE, API_CONNECT_TIMEOUT, API_READ_TIMEOUT, API_RETRIES, API_BACKOFF, API_MAX_RETRY_AFTER
+)
 
 
 # Exceptions
@@ -17,18 +29,39 @@ class DocumentNotFound(Exception):
     pass
 
 
+class DataNotPublished(DocumentNotFound):
+    pass
+
+
+# HTTP
+_session = None
+_session_mutex = threading.Lock()
+def get_session() -> 'requests.Session':
+    # One keep-alive pool shared by every ReeCache, they are created per request
+    global _session
+    with _session_mutex:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=API_POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
 # API
 class ReeAPI:
-    def __init__(self, token=API_TOKEN):
-        self.cache = ReeCache(token)
+    def __init__(self, token=API_TOKEN, base_url: str=BASE_API):
+        self.cache = ReeCache(token, base_url)
     
-    def _request(self, method: str, year: int, month: int, day: int) -> dict:
+    def _get_date(self, year: int, month: int, day: int) -> 'dt.datetime':
         try:
-            date = dt.datetime(year, month, day)
+            return dt.datetime(year, month, day)
         except TypeError:
             today = dt.date.today()
-            date = dt.datetime(today.year, today.month, today.day)
-        return self.cache.get_data(method, date)
+            return dt.datetime(today.year, today.month, today.day)
+
+    def _request(self, method: str, year: int, month: int, day: int) -> dict:
+        return self.cache.get_data(method, self._get_date(year, month, day))
         
     def get_prices(self, year: int=None, month: int=None, day: int=None) -> dict:
         return self._request("prices", year, month, day)
@@ -36,15 +69,37 @@ class ReeAPI:
     def get_sections(self, year: int=None, month: int=None, day: int=None) -> dict:
         return self._request("sections", year, month, day)
 
+    def get_day_values(self, method: str, geolocation: str, year: int=None, month: int=None, day: int=None) -> tuple:
+        return self.cache.get_day_values(method, geolocation, self._get_date(year, month, day))
+
+    def backfill(self, start_date: 'dt.datetime', end_date: 'dt.datetime', **kwargs) -> dict:
+        return self.cache.backfill(start_date, end_date, **kwargs)
+
 
 class ReeCache:
-    def __init__(self, token):
+    # Callbacks run as callback(method, date) every time a document is (re)written
+    listeners = []
+
+    # Request metrics and the last response of every request, revalidated with ETag/Last-Modified
+    latency = {"prices": LatencyStats(), "sections": LatencyStats()}
+    counters = {"requests": 0, "retries": 0, "not_modified": 0, "errors": 0, "unpublished_hits": 0}
+    _counters_mutex = threading.Lock()
+    validators = LRUCache(64)
+
+    # Concurrent misses of the same (method, date) wait for a single request
+    flights = SingleFlight()
+
+    # Negative cache: (method, date) -> (expiration timestamp, refresh timer) of days REE has not published yet
+    unpublished = {}
+    _unpublished_mutex = threading.Lock()
+
+    def __init__(self, token, base_url: str=BASE_API):
         self.token = token
 
         # Request urls
         self.urls = {
-            "prices": PRICES_URL,
-            "sections": SECTIONS_URL
+            "prices": f"{base_url}/indicators/{PRICES_INDICATOR}",
+            "sections": f"{base_url}/indicators/{SECTIONS_INDICATOR}"
         }
 
         # Request headers
@@ -54,10 +109,10 @@ class ReeCache:
         if self.token:
             self.headers["Authorization"] = f'Token token="{self.token}"'
     
-    def _generate_request_params(self, start_date: 'dt.datetime') -> dict:
+    def _generate_request_params(self, start_date: 'dt.datetime', days: int=1) -> dict:
         params = {}
         if self.token:
-            end_date = start_date + dt.timedelta(days=1, seconds=-1)
+            end_date = start_date + dt.timedelta(days=days, seconds=-1)
             params["start_date"] = start_date.strftime(API_DATETIME_FORMAT)
             params["end_date"] = end_date.strftime(API_DATETIME_FORMAT)
         return params
@@ -66,36 +121,258 @@ class ReeCache:
         filename = f"{method}_{date.strftime('%Y%m%d')}.json"
         return os.path.join(CACHE_DIR, filename)
 
+    def has_document(self, method: str, date: 'dt.datetime') -> bool:
+        return get_price_store().has_day(method, date) or os.path.exists(self._generate_file_path(method, date))
+
     def get_document(self, method: str, date: 'dt.datetime') -> dict:
+        store = get_price_store()
+        if store.has_day(method, date):
+            return store.get_document(method, date)
+
+        # Documents cached as JSON by previous versions are moved to the store on first use
         document = self._generate_file_path(method, date)
-        if os.path.exists(document):
-            with open(document, "r") as f:
-                return json.loads(f.read())
+        if document_cache.get(document):
+            data = load_data(document)
+            store.put_document(data, method, date)
+            return data
         raise DocumentNotFound()
+
+    def get_day_values(self, method: str, geolocation: str, date: 'dt.datetime') -> tuple:
+        store = get_price_store()
+        if not store.has_day(method, date):
+            metrics.count("ree.store_misses")
+            self.get_data(method, date)
+        else:
+            metrics.count("ree.store_hits")
+        day = store.get_day(method, geolocation, date)
+        if day is None:
+            raise DocumentNotFound(f"No {method} for {geolocation} on {date}")
+        return day
     
     def put_document(self, data: dict, method: str, date: 'dt.datetime') -> None:
-        store_data(data, self._generate_file_path(method, date))
+        # Written synchronously so listeners never see the previous version of the document
+        get_price_store().put_document(data, method, date)
+        for listener in self.listeners:
+            listener(method, date)
+
+    @classmethod
+    def add_listener(cls, listener: 'Callable[[str, dt.datetime], None]') -> None:
+        cls.listeners.append(listener)
+
+    @classmethod
+    def add_day_listener(cls, listener: 'Callable[[dt.datetime], None]') -> None:
+        # Only called once every document needed to analyze the day is stored
+        def day_listener(method, date):
+            cache = cls(token=None)
+            if all(cache.has_document(document, date) for document in cache.urls):
+                listener(date)
+        cls.add_listener(day_listener)
     
-    def request(self, method: str, start_date: 'dt.datetime') -> dict:
-        response = requests.get(
-            self.urls[method],
-            headers=self.headers,
-            params=self._generate_request_params(start_date)
-        )
+    @metrics.timed("ree.request")
+    def request(self, method: str, start_date: 'dt.datetime', days: int=1) -> dict:
+        url = self.urls[method]
+        params = self._generate_request_params(start_date, days)
+        validator_key = (url, tuple(sorted(params.items())))
+        validator = self.validators.get(validator_key)
+
+        headers = dict(self.headers)
+        if validator is not None:
+            if validator["etag"]:
+                headers["If-None-Match"] = validator["etag"]
+            if validator["last_modified"]:
+                headers["If-Modified-Since"] = validator["last_modified"]
+
+        response = self._send(method, url, headers, params)
+        if response.status_code == 304 and validator is not None:
+            self._count("not_modified")
+            return validator["data"]
         response.raise_for_status()
 
         try:
-            return response.json()
+            data = response.json()
         except JSONDecodeError:
             raise ResponseError(f"Could not parse response: {response.text}")
 
+        # Backfill ranges are fetched once, only single days are worth revalidating
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if days == 1 and (etag or last_modified):
+            self.validators.put(validator_key, {"etag": etag, "last_modified": last_modified, "data": data})
+        return data
+
+    def _send(self, method: str, url: str, headers: dict, params: dict) -> 'requests.Response':
+        for attempt in range(API_RETRIES + 1):
+            last_attempt = attempt == API_RETRIES
+            # Full jitter, concurrent retries do not hit ESIOS at the same time
+            backoff = random.uniform(0, API_BACKOFF * 2 ** attempt)
+            self._count("requests")
+            start = time.perf_counter()
+            try:
+                response = get_session().get(url, headers=headers, params=params, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+            except (requests.ConnectionError, requests.Timeout):
+                self._count("errors")
+                if last_attempt:
+                    raise
+                self._count("retries")
+                time.sleep(backoff)
+                continue
+            finally:
+                self.latency[method].add(time.perf_counter() - start)
+
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            self._count("errors")
+            if last_attempt:
+                return response
+            retry_after = self._retry_after(response.headers.get("Retry-After", ""))
+            if retry_after > API_MAX_RETRY_AFTER:
+                # Nobody waits that long for an answer, it fails as any other error response
+                return response
+            self._count("retries")
+            time.sleep(max(backoff, retry_after))
+
+    @staticmethod
+    def _retry_after(value: str) -> float:
+        # Seconds or an HTTP date, 0 when missing or malformed
+        if value.strip().isdigit():
+            return int(value)
+        try:
+            return max((parsedate_to_datetime(value) - dt.datetime.now(dt.timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return 0
+
+    @classmethod
+    def _count(cls, counter: str) -> None:
+        with cls._counters_mutex:
+            cls.counters[counter] += 1
+
+    @classmethod
+    def get_metrics(cls) -> dict:
+        return {
+            **cls.counters,
+            "latency": {method: latency.summary() for method, latency in cls.latency.items()},
+            "flights": cls.flights.stats()
+        }
+
+    @metrics.timed("ree.get_data")
     def get_data(self, method: str, start_date: 'dt.datetime') -> dict:
         try:
             # Check if cached
-            response_data = self.get_document(method, start_date)
+            return self.get_document(method, start_date)
+        except DocumentNotFound:
+            if self.is_unpublished(method, start_date):
+                self._count("unpublished_hits")
+                raise DataNotPublished(f"No {method} published for {start_date} yet")
+            return self.flights.do((method, start_date), lambda: self._fetch_data(method, start_date))
+
+    def is_unpublished(self, method: str, date: 'dt.datetime') -> bool:
+        with self._unpublished_mutex:
+            entry = self.unpublished.get((method, date))
+            return entry is not None and entry[0] > time.time()
+
+    def _unpublished_ttl(self, date: 'dt.datetime') -> float:
+        publication = dt.datetime.combine(date.date() - dt.timedelta(days=1), dt.time(*PUBLICATION_TIME))
+        seconds_left = (publication - dt.datetime.now()).total_seconds()
+        # Once it should be out (REE is late, or the day has no data) just check again from time to time.
+        # Far future days are not waited for, they are asked again after the cap
+        return min(seconds_left, UNPUBLISHED_MAX_TTL) if seconds_left > 0 else UNPUBLISHED_RETRY
+
+    def _set_unpublished(self, method: str, date: 'dt.datetime') -> None:
+        ttl = self._unpublished_ttl(date)
+        timer = None
+        # Today and tomorrow are requested again as soon as they should be available,
+        # any other day only on demand once its negative entry expires
+        if 0 <= (date.date() - dt.date.today()).days <= 1:
+            timer = threading.Timer(ttl, self._refresh_unpublished, args=(method, date))
+            timer.daemon = True
+        with self._unpublished_mutex:
+            # Expired entries of days nobody asked for again are dropped, the cache stays as big as the recent misses
+            now = time.time()
+            for key in [key for key, (expiration, entry_timer) in self.unpublished.items() if expiration <= now and entry_timer is None]:
+                del self.unpublished[key]
+            previous = self.unpublished.get((method, date))
+            if previous is not None and previous[1] is not None:
+                previous[1].cancel()
+            self.unpublished[method, date] = (time.time() + ttl, timer)
+        if timer is not None:
+            timer.start()
+
+    def _refresh_unpublished(self, method: str, date: 'dt.datetime') -> None:
+        with self._unpublished_mutex:
+            self.unpublished.pop((method, date), None)
+        try:
+            self.get_data(method, date)
+        except DataNotPublished:
+            pass
+        except Exception:
+            # Keep polling, the next attempt may work
+            self._set_unpublished(method, date)
+
+    def _fetch_data(self, method: str, start_date: 'dt.datetime') -> dict:
+        try:
+            # Another flight may have stored it right before this one started
+            return self.get_document(method, start_date)
         except DocumentNotFound:
             # Make the request and save the result
             response_data = self.request(method, start_date)
-            if response_data["indicator"]["values"]:
-                self.put_document(response_data, method, start_date)
-        return response_data
+            if not response_data["indicator"]["values"]:
+                self._set_unpublished(method, start_date)
+                raise DataNotPublished(f"No {method} published for {start_date} yet")
+            with self._unpublished_mutex:
+                self.unpublished.pop((method, start_date), None)
+            self.put_document(response_data, method, start_date)
+            return response_data
+
+    def request_range(self, method: str, start_date: 'dt.datetime', days: int) -> dict:
+        # A single request for the whole window, split in the same per-day documents `request` returns
+        response_data = self.request(method, start_date, days)
+        documents = {}
+        for value in response_data["indicator"]["values"]:
+            date = dt.datetime.strptime(value["datetime"][:10], "%Y-%m-%d")
+            documents.setdefault(date, []).append(value)
+        return {
+            date: {**response_data, "indicator": {**response_data["indicator"], "values": values}}
+            for date, values in documents.items()
+        }
+
+    def get_range(self, method: str, start_date: 'dt.datetime', days: int) -> list:
+        dates = [start_date + dt.timedelta(days=i) for i in range(days)]
+        missing = [date for date in dates if not self.has_document(method, date)]
+        if missing:
+            # Only the window between the first and the last missing day is requested again
+            fetched = self.request_range(method, missing[0], (missing[-1] - missing[0]).days + 1)
+            for date in missing:
+                if date in fetched and fetched[date]["indicator"]["values"]:
+                    self.put_document(fetched[date], method, date)
+        return [date for date in dates if self.has_document(method, date)]
+
+    def backfill(self, start_date: 'dt.datetime', end_date: 'dt.datetime', chunk_days: int=BACKFILL_CHUNK_DAYS, max_workers: int=BACKFILL_WORKERS) -> dict:
+        chunks = []
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + dt.timedelta(days=chunk_days - 1), end_date)
+            chunks.extend((method, chunk_start, (chunk_end - chunk_start).days + 1) for method in self.urls)
+            chunk_start = chunk_end + dt.timedelta(days=1)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda chunk: (chunk[0], len(self.get_range(*chunk))), chunks))
+        # Chunks land in any order, leave the history contiguous for range reads
+        get_price_store().compact()
+
+        return {method: sum(days for result_method, days in results if result_method == method) for method in self.urls}
+
+
+def _document_stored(file_path: str) -> bool:
+    # "prices_20220131.json", removing it before it is in the price store would lose the day
+    method, day = os.path.splitext(os.path.basename(file_path))[0].split("_")
+    return get_price_store().has_day(method, dt.datetime.strptime(day, "%Y%m%d"))
+
+
+document_cache = CacheManager(
+    "documents", CACHE_DIR, r"(prices|sections)_\d{8}\.json",
+    max_bytes=DOCUMENT_CACHE_MAX_BYTES, max_age=DOCUMENT_CACHE_MAX_AGE, can_evict=_document_stored
+)
+
+
+metrics.add_collector("ree", lambda: ReeCache.counters)
+metrics.add_collector("ree.flights", ReeCache.flights.stats)
+metrics.add_collector("ree.validators", ReeCache.validators.stats)
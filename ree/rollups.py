@@ -0,0 +1,172 @@
+import os
+import zlib
+import sqlite3
+import threading
+import datetime as dt
+
+from pvpc_bot.ree.ree_api import ReeCache
+from pvpc_bot.ree.price_store import get_price_store, align_sections
+from pvpc_bot.ree.summary import percentile_index
+from pvpc_bot.ree.chart_renderer import new_figure, FONT
+from pvpc_bot.ree.price_analyzer import chart_cache
+from pvpc_bot.bot.utils.images import get_geo_slug, get_image_title
+from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.config import (
+    ROLLUPS_DB, SECTION_DATA, ROUND_DECIMALS, LOW_PERCENTILE, HIGH_PERCENTILE,
+    IMAGE_DIR, IMAGE_Y_LABEL
+)
+
+
+SECTION_COLUMNS = ", ".join(f"{name}_total REAL NOT NULL, {name}_count INTEGER NOT NULL" for name, _ in SECTION_DATA)
+
+
+class RollupStore:
+    # One row per (geolocation, day) with everything that can be added up over a range.
+    # Percentiles can not, they are computed from the price store columns of the range
+    def __init__(self, db_path: str=ROLLUPS_DB):
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS daily ("
+            "geolocation TEXT NOT NULL, day TEXT NOT NULL, count INTEGER NOT NULL, total REAL NOT NULL, "
+            "min REAL NOT NULL, min_minutes INTEGER NOT NULL, max REAL NOT NULL, max_minutes INTEGER NOT NULL, "
+            f"{SECTION_COLUMNS}, PRIMARY KEY (geolocation, day))"
+        )
+        self._connection.commit()
+        self._mutex = threading.Lock()
+
+    @staticmethod
+    def _day_row(geolocation: str, date: 'dt.date') -> tuple:
+        store = get_price_store()
+        prices, sections = store.get_day("prices", geolocation, date), store.get_day("sections", geolocation, date)
+        if prices is None or sections is None or not len(prices[1]):
+            return None
+        price_minutes, values = prices
+        sections = align_sections(price_minutes, *sections)
+
+        # Transform MWh to kWh
+        values = [value / 1000 for value in values]
+        low, high = min(range(len(values)), key=values.__getitem__), max(range(len(values)), key=values.__getitem__)
+        section_totals = {section_id: [0, 0] for _, section_id in SECTION_DATA}
+        for value, section in zip(values, sections):
+            section_totals[section][0] += value
+            section_totals[section][1] += 1
+
+        row = [geolocation, date.isoformat(), len(values), sum(values), values[low], price_minutes[low], values[high], price_minutes[high]]
+        for _, section_id in SECTION_DATA:
+            row.extend(section_totals[section_id])
+        return tuple(row)
+
+    def update_day(self, date: 'dt.date') -> int:
+        rows = [row for row in (self._day_row(geolocation, date) for geolocation in list(get_price_store().geos)) if row]
+        with self._mutex, self._connection:
+            self._connection.executemany(f"INSERT OR REPLACE INTO daily VALUES ({', '.join('?' * (8 + 2 * len(SECTION_DATA)))})", rows)
+        return len(rows)
+
+    def catch_up(self, geolocation: str, start_date: 'dt.date', end_date: 'dt.date') -> int:
+        # Days stored before the rollups existed, or by a process without the listener
+        with self._mutex:
+            known = {day for day, in self._connection.execute(
+                "SELECT day FROM daily WHERE geolocation = ? AND day BETWEEN ? AND ?",
+                (geolocation, start_date.isoformat(), end_date.isoformat())
+            )}
+        store = get_price_store()
+        if geolocation not in store.geos:
+            return 0
+        prices, sections = store.column("prices", geolocation), store.column("sections", geolocation)
+        updated = 0
+        for i in range((end_date - start_date).days + 1):
+            date = start_date + dt.timedelta(days=i)
+            if date.isoformat() not in known and prices.locate(date) is not None and sections.locate(date) is not None:
+                updated += self.update_day(date)
+        return updated
+
+    def get_stats(self, geolocation: str, start_date: 'dt.date', end_date: 'dt.date') -> dict:
+        self.catch_up(geolocation, start_date, end_date)
+        where = ("geolocation = ? AND day BETWEEN ? AND ?", (geolocation, start_date.isoformat(), end_date.isoformat()))
+        section_sums = ", ".join(f"SUM({name}_total), SUM({name}_count)" for name, _ in SECTION_DATA)
+        with self._mutex:
+            days, count, total, *section_values = self._connection.execute(
+                f"SELECT COUNT(*), SUM(count), SUM(total), {section_sums} FROM daily WHERE {where[0]}", where[1]
+            ).fetchone()
+            if not days:
+                return None
+            extremes = {
+                name: self._connection.execute(
+                    f"SELECT day, {name}_minutes, {name} FROM daily WHERE {where[0]} ORDER BY {name} {order}, day LIMIT 1", where[1]
+                ).fetchone()
+                for name, order in (("min", "ASC"), ("max", "DESC"))
+            }
+            daily = self._connection.execute(
+                f"SELECT day, total / count, min, max FROM daily WHERE {where[0]} ORDER BY day", where[1]
+            ).fetchall()
+
+        # The percentiles need every price of the range, a contiguous slice of the columnar store
+        _, _, values = get_price_store().get_range("prices", geolocation, start_date, end_date)
+        values = sorted(values)
+        return {
+            "geolocation": geolocation,
+            "start": start_date,
+            "end": end_date,
+            "days": days,
+            "mean": round(total / count, ROUND_DECIMALS),
+            "low_percentile": round(values[percentile_index(len(values), LOW_PERCENTILE)] / 1000, ROUND_DECIMALS),
+            "high_percentile": round(values[percentile_index(len(values), HIGH_PERCENTILE)] / 1000, ROUND_DECIMALS),
+            **{
+                name: {
+                    "price": round(price, ROUND_DECIMALS),
+                    "datetime": dt.datetime.fromisoformat(day) + dt.timedelta(minutes=minutes)
+                }
+                for name, (day, minutes, price) in extremes.items()
+            },
+            "section_means": {
+                name: round(section_values[2 * i] / section_values[2 * i + 1], ROUND_DECIMALS) if section_values[2 * i + 1] else 0
+                for i, (name, _) in enumerate(SECTION_DATA)
+            },
+            "daily": [(dt.date.fromisoformat(day), mean, low, high) for day, mean, low, high in daily]
+        }
+
+
+def generate_history_png(stats: dict) -> str:
+    # Versioned by the plotted values, a day added or published again is a new chart
+    version = zlib.crc32(repr(stats["daily"]).encode())
+    file_path = os.path.join(
+        IMAGE_DIR,
+        f"history_{get_geo_slug(stats['geolocation'])}_{stats['start']:%Y%m%d}_{stats['end']:%Y%m%d}_{version:08x}.png"
+    )
+    if chart_cache.get(file_path):
+        return file_path
+
+    log("Gennerating the history PNG file '%s'.", file_path, level="INFO")
+    days, means, lows, highs = zip(*stats["daily"])
+    # Ranges change shape from chart to chart, a fresh figure each time (no pyplot state shared with other threads)
+    figure = new_figure()
+    axes = figure.add_subplot()
+    axes.fill_between(days, lows, highs, color="lightgrey", label="Mínimo - máximo")
+    axes.plot(days, means, color="black", linewidth=2, label="Media diaria")
+    axes.set_ylabel(IMAGE_Y_LABEL, fontdict={**FONT, 'size': 10, 'verticalalignment': 'baseline'})
+    axes.set_title(f"{get_image_title(stats['start'])} -\n{get_image_title(stats['end'])}", fontdict={**FONT, 'size': 12})
+    axes.legend()
+    figure.autofmt_xdate()
+
+    tmp_file_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    figure.savefig(tmp_file_path, format="png")
+    os.replace(tmp_file_path, file_path)
+    chart_cache.put(file_path)
+    return file_path
+
+
+_rollup_store = None
+_rollup_store_mutex = threading.Lock()
+def get_rollup_store() -> 'RollupStore':
+    global _rollup_store
+    with _rollup_store_mutex:
+        if _rollup_store is None:
+            _rollup_store = RollupStore()
+        return _rollup_store
+
+
+def enable_rollups() -> None:
+    # Every new day is added to the rollups as soon as both of its documents are stored
+    ReeCache.add_day_listener(lambda date: get_rollup_store().update_day(date.date()))
@@ -0,0 +1,81 @@
+import math
+import zlib
+import datetime as dt
+from array import array
+
+from pvpc_bot.bot.utils.sections import get_section
+from pvpc_bot.config import ROUND_DECIMALS, LOW_PERCENTILE, HIGH_PERCENTILE, SECTION_DATA
+
+
+def percentile_index(length: int, percentile: int) -> int:
+    return min(math.ceil(length * (percentile / 100)), length - 1)
+
+
+class DaySummary:
+    __slots__ = (
+        "day", "data", "order", "mean", "low_percentile", "high_percentile", "max", "min",
+        "section_means", "section_indexes", "percentile_sections", "percentile_indexes", "version"
+    )
+
+    def __init__(self, day: 'dt.datetime', data: list):
+        data = tuple(data)
+        order = tuple(sorted(range(len(data)), key=lambda i: data[i]["price"]))
+        low_percentile = round(data[order[percentile_index(len(data), LOW_PERCENTILE)]]["price"], ROUND_DECIMALS)
+        high_percentile = round(data[order[percentile_index(len(data), HIGH_PERCENTILE)]]["price"], ROUND_DECIMALS)
+
+        # Single pass over the hours for the section means and both index groupings
+        total = 0
+        section_totals = {section_id: 0 for _, section_id in SECTION_DATA}
+        section_indexes = {section_id: [] for _, section_id in SECTION_DATA}
+        percentile_indexes = {section_id: [] for _, section_id in SECTION_DATA}
+        percentile_sections = []
+        for i, price in enumerate(data):
+            total += price["price"]
+            section_totals[price["section"]] += price["price"]
+            section_indexes[price["section"]].append(i)
+
+            percentile_section = get_section(price["price"], low_percentile, high_percentile)
+            percentile_indexes[percentile_section].append(i)
+            percentile_sections.append(percentile_section)
+
+        values = {
+            "day": day,
+            "data": data,
+            "order": order,
+            "mean": round(total / len(data), ROUND_DECIMALS),
+            "low_percentile": low_percentile,
+            "high_percentile": high_percentile,
+            "max": data[order[-1]],
+            "min": data[order[0]],
+            "section_means": {
+                section_name: round(section_totals[section_id] / len(section_indexes[section_id]), ROUND_DECIMALS)
+                if section_indexes[section_id] else 0
+                for section_name, section_id in SECTION_DATA
+            },
+            "section_indexes": {
+                section_name: tuple(section_indexes[section_id]) for section_name, section_id in SECTION_DATA
+            },
+            "percentile_sections": tuple(percentile_sections),
+            "percentile_indexes": {
+                section_name: tuple(percentile_indexes[section_id]) for section_name, section_id in SECTION_DATA
+            },
+            # Changes whenever REE publishes different prices or sections for the day, part of the chart cache keys
+            "version": f"{zlib.crc32(array('d', (price['price'] for price in data)).tobytes() + bytes(price['section'] for price in data)):08x}"
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: 'Any') -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def get_percentile(self, percentile: int) -> float:
+        return round(self.data[self.order[percentile_index(len(self.data), percentile)]]["price"], ROUND_DECIMALS)
+
+    def get_indexes(self, colors: str) -> dict:
+        return self.section_indexes if colors == "sections" else self.percentile_indexes
+
+    def get_hour_section(self, index: int, colors: str) -> int:
+        return self.data[index]["section"] if colors == "sections" else self.percentile_sections[index]
+
+    def get_sorted_data(self) -> list:
+        return [self.data[i] for i in self.order]
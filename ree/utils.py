@@ -1,6 +1,7 @@
 import json
 import threading
 import datetime as dt
+from collections import OrderedDict, deque
 
 from pvpc_bot.config import DATETIME_FORMAT
 
@@ -26,3 +27,174 @@ def store_data(json_data: dict, file_path: str, wait: bool=False) -> None:
 def load_data(file_path: str) -> dict:
     with open(file_path, "rt") as f:
         return json.loads(f.read())
+
+
+_missing = object()
+class LRUCache:
+    def __init__(self, max_size: int=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        # key -> [generation, builders] of the keys being built, invalidate bumps the generation
+        self._building = {}
+        self._mutex = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: 'Hashable', default: 'Any'=None) -> 'Any':
+        with self._mutex:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: 'Hashable', value: 'Any') -> None:
+        with self._mutex:
+            self._put(key, value)
+
+    def _put(self, key: 'Hashable', value: 'Any') -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def get_or_create(self, key: 'Hashable', factory: 'Callable[[], Any]') -> 'Any':
+        with self._mutex:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            building = self._building.setdefault(key, [0, 0])
+            building[1] += 1
+            generation = building[0]
+
+        # Built outside the lock, a concurrent builder of the same key just overwrites it.
+        # A value built from data invalidated in the meantime is returned but not cached
+        value = _missing
+        try:
+            value = factory()
+        finally:
+            with self._mutex:
+                if value is not _missing and building[0] == generation:
+                    self._put(key, value)
+                building[1] -= 1
+                if not building[1]:
+                    del self._building[key]
+        return value
+
+    def invalidate(self, predicate: 'Callable[[Hashable], bool]'=None) -> int:
+        with self._mutex:
+            for key, building in self._building.items():
+                if predicate is None or predicate(key):
+                    building[0] += 1
+            keys = [key for key in self._data if predicate is None or predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._mutex:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0
+            }
+
+
+
+class LatencyStats:
+    def __init__(self, max_samples: int=2048):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        # Percentiles are computed over the most recent samples only
+        self._samples = deque(maxlen=max_samples)
+        self._mutex = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._mutex:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._samples.append(seconds)
+
+    def percentile(self, percentile: int) -> float:
+        with self._mutex:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0
+        return samples[min(int(len(samples) * percentile / 100), len(samples) - 1)]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max
+        }
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._mutex = threading.Lock()
+
+    def do(self, key: 'Hashable', function: 'Callable[[], Any]') -> 'Any':
+        with self._mutex:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Wait for the caller already doing the work and share its outcome
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._mutex:
+                del self._flights[key]
+            flight.event.set()
+
+    def stats(self) -> dict:
+        with self._mutex:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)
+            }
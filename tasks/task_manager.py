@@ -3,8 +3,11 @@ import datetime as dt
 import telebot
 
 from pvpc_bot.bot.user_settings import SettingsManager
-from pvpc_bot.bot.utils.actions import send_report_message
+from pvpc_bot.bot.utils.actions import prepare_report, send_prepared_report
+from pvpc_bot.bot.utils.delivery import DeliveryEngine
 from pvpc_bot.bot.utils.logs import log
+from pvpc_bot.ree.price_analyzer import PriceAnalyzer
+from pvpc_bot.ree.prerender import prerender_day
 from pvpc_bot.config import BOT_TOKEN
 
 
@@ -14,9 +17,39 @@ def daily_report():
 
     now = dt.datetime.now()
     today = dt.datetime(now.year, now.month, now.day)
-    log(text=f"Starting task sending for day: {today}")
-    for user_id in settings_manager.users:
-        # Get the user settings and send the proper data to them
-        if settings_manager.users[user_id]["subscribed"]:
-            log(text=f"Message sento to {user_id} with date: {today}")
-            send_report_message(bot, user_id, today)
+    log("Starting task sending for day: %s", today)
+    subscribers = settings_manager.get_subscribers()
+
+    # Every distinct payload is rendered once, then streamed to all of its users
+    reports = {}
+    for timezone, colors in subscribers:
+        try:
+            reports[timezone, colors] = prepare_report(today, timezone, colors)
+        except Exception as e:
+            log("Could not prepare the report (%s, %s) for day %s: %r", timezone, colors, today, e, level="ERROR")
+
+    def recipients():
+        for bucket, user_ids in subscribers.items():
+            if bucket in reports:
+                for user_id in user_ids:
+                    yield bucket, user_id
+
+    def send(rate_limited_bot, recipient):
+        bucket, user_id = recipient
+        log("Message sent to %s with date: %s", user_id, today)
+        send_prepared_report(rate_limited_bot, user_id, reports[bucket])
+
+    stats = DeliveryEngine(bot).deliver(recipients(), send)
+    log("Daily report for day %s finished: %s", today, stats, level="INFO")
+
+
+def prerender_next_day():
+    now = dt.datetime.now()
+    tomorrow = dt.datetime(now.year, now.month, now.day) + dt.timedelta(days=1)
+    try:
+        # Fetching the data is enough to trigger the rendering if the bot process is listening
+        PriceAnalyzer(tomorrow)
+    except Exception as e:
+        log("Data for day %s not available yet: %r", tomorrow, e, level="WARNING")
+    else:
+        prerender_day(tomorrow)
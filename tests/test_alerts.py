@@ -0,0 +1,96 @@
+import unittest
+from types import SimpleNamespace
+
+from pvpc_bot.bot.bot import parse_alert
+from pvpc_bot.bot.user_settings import SettingsManager
+from pvpc_bot.bot.utils.alerts import match_price_alerts
+
+
+class MemoryStorage:
+    def __init__(self):
+        self.users = {}
+
+    def load_all(self) -> dict:
+        return dict(self.users)
+
+    def save(self, user_id: int, data: dict) -> None:
+        self.users[user_id] = dict(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class AlertSettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.settings_manager = SettingsManager(restore_backup=False, storage=MemoryStorage())
+
+    def test_alerts_do_not_subscribe(self):
+        # What /alertas does for a chat that never used /start
+        self.settings_manager.register_user(1, subscribed=False)
+        self.settings_manager.set_config(1, "alerts", [{"type": "price", "threshold": 0.1}])
+        self.assertEqual(self.settings_manager.get_subscribers(), {})
+        self.assertEqual(list(self.settings_manager.get_price_alerts("Península")[1]), [1])
+
+    def test_subscribed_users_stay_subscribed(self):
+        self.settings_manager.register_user(1)
+        self.settings_manager.register_user(1, subscribed=False)
+        self.assertEqual(self.settings_manager.get_subscribers(), {("Península", "percentiles"): [1]})
+
+    def test_sorted_price_alerts(self):
+        for user_id, threshold in ((1, 0.2), (2, 0.1), (3, 0.2), (4, 0.15)):
+            self.settings_manager.set_config(user_id, "alerts", [{"type": "price", "threshold": threshold}])
+        # Stored before thresholds were validated
+        self.settings_manager.set_config(5, "alerts", [{"type": "price", "threshold": float("nan")}])
+        thresholds, user_ids = self.settings_manager.get_price_alerts("Península")
+        self.assertEqual(list(thresholds), [0.1, 0.15, 0.2, 0.2])
+        self.assertEqual(list(user_ids), [2, 4, 1, 3])
+
+        # Changed alerts are seen on the next read
+        self.settings_manager.set_config(2, "alerts", [])
+        self.assertEqual(list(self.settings_manager.get_price_alerts("Península")[1]), [4, 1, 3])
+        self.assertEqual(list(self.settings_manager.get_price_alerts("Canarias")[0]), [])
+
+
+class MatchPriceAlertsTest(unittest.TestCase):
+    def summary(self, prices: list) -> 'SimpleNamespace':
+        return SimpleNamespace(data=[{"price": price} for price in prices], order=sorted(range(len(prices)), key=lambda i: prices[i]))
+
+    def matches(self, prices: list, thresholds: list) -> dict:
+        # threshold -> hours strictly below it
+        summary = self.summary(prices)
+        return {
+            thresholds[i]: sorted(summary.order[:count])
+            for count, start, end in match_price_alerts(summary, thresholds) for i in range(start, end)
+        }
+
+    def test_thresholds(self):
+        prices = [0.3, 0.1, 0.2, 0.4]
+        self.assertEqual(self.matches(prices, [0.05, 0.15, 0.25, 0.5]), {0.15: [1], 0.25: [1, 2], 0.5: [0, 1, 2, 3]})
+
+    def test_boundary(self):
+        # A price equal to the threshold is not below it
+        prices = [0.3, 0.1, 0.2]
+        self.assertEqual(self.matches(prices, [0.1, 0.2, 0.3]), {0.2: [1], 0.3: [1, 2]})
+        self.assertEqual(self.matches(prices, [0.1000001]), {0.1000001: [1]})
+
+    def test_equal_prices(self):
+        self.assertEqual(self.matches([0.2, 0.2, 0.1], [0.2, 0.21, 0.21]), {0.2: [2], 0.21: [0, 1, 2]})
+
+    def test_no_thresholds(self):
+        self.assertEqual(match_price_alerts(self.summary([0.1, 0.2]), []), [])
+
+
+class ParseAlertTest(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(parse_alert(["precio", "0,12"]), {"type": "price", "threshold": 0.12})
+        self.assertEqual(parse_alert(["ventana", "3"]), {"type": "window", "hours": 3})
+
+    def test_invalid(self):
+        for arguments in (["precio", "nan"], ["precio", "inf"], ["precio", "-inf"], ["precio", "0"], ["precio", "-1"],
+                          ["precio", "x"], ["ventana", "0"], ["ventana", "100"], ["ventana", "1.5"], ["otra", "1"]):
+            with self.assertRaises(ValueError, msg=arguments):
+                parse_alert(arguments)
+
+
+if __name__ == "__main__":
+    unittest.main()
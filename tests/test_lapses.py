@@ -0,0 +1,59 @@
+import random
+import unittest
+import datetime as dt
+
+from pvpc_bot.ree.lapses import cheapest_windows
+from pvpc_bot.bot.utils.actions import find_best_lapse
+
+
+def make_price_data(days: int, points: int) -> list:
+    rng = random.Random(points)
+    start = dt.datetime(2022, 1, 31)
+    step = dt.timedelta(days=1) / points
+    return [{"price": rng.uniform(0.05, 0.3), "datetime": start + i * step} for i in range(days * points)]
+
+
+class FindBestLapseTest(unittest.TestCase):
+    def test_quarter_hour_labels(self):
+        # Two days of 96 points, as /analisis X searches when tomorrow is published
+        price_data = make_price_data(2, 96)
+        windows = find_best_lapse(2, price_data, top_k=10, non_overlapping=True)
+        labels = [(window["start"], window["end"]) for window in windows]
+        self.assertEqual(len(labels), len(set(labels)))
+        for window in windows:
+            self.assertRegex(window["start"], r"^\d\d:\d\d( \(\+1\))?$")
+
+    def test_quarter_hour_start(self):
+        price_data = make_price_data(1, 96)
+        for price in price_data:
+            price["price"] = 1
+        # The cheapest hour starts at 10:15
+        for price in price_data[41:45]:
+            price["price"] = 0
+        window = find_best_lapse(1, price_data, top_k=1)[0]
+        self.assertEqual((window["start"], window["end"]), ("10:15", "11:15"))
+        self.assertEqual(window["sum"], 0)
+
+    def test_hourly_labels(self):
+        window = find_best_lapse(3, make_price_data(2, 24), top_k=1)[0]
+        self.assertRegex(window["start"], r"^\d\dh( \(\+1\))?$")
+
+
+class CheapestWindowsTest(unittest.TestCase):
+    def test_non_overlapping(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            prices = [rng.choice((1, 2, 3, rng.randint(0, 100))) for _ in range(rng.randint(1, 200))]
+            length = rng.randint(1, 12)
+            # Reference: every window sorted, greedily keeping the ones disjoint from those kept
+            expected = []
+            for total, start in sorted((sum(prices[s:s + length]), s) for s in range(len(prices) - length + 1)):
+                if all(abs(start - other) >= length for _, other in expected):
+                    expected.append((total, start))
+            windows = cheapest_windows(prices, length, non_overlapping=True)
+            self.assertEqual([start for _, start in windows], [start for _, start in expected])
+            self.assertEqual(cheapest_windows(prices, length, top_k=3, non_overlapping=True), windows[:3])
+
+
+if __name__ == "__main__":
+    unittest.main()
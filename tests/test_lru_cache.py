@@ -0,0 +1,46 @@
+import unittest
+
+from pvpc_bot.ree.utils import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_get_or_create(self):
+        cache = LRUCache(2)
+        self.assertEqual(cache.get_or_create("a", lambda: 1), 1)
+        self.assertEqual(cache.get_or_create("a", lambda: 2), 1)
+        cache.put("b", 2)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_invalidated_while_building(self):
+        cache = LRUCache()
+
+        def factory():
+            # The data the value is built from changes before the build finishes
+            cache.invalidate(lambda key: key == "a")
+            return "stale"
+        self.assertEqual(cache.get_or_create("a", factory), "stale")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_or_create("a", lambda: "fresh"), "fresh")
+        self.assertEqual(cache.get("a"), "fresh")
+
+    def test_other_key_invalidated_while_building(self):
+        cache = LRUCache()
+
+        def factory():
+            cache.invalidate(lambda key: key == "b")
+            return 1
+        cache.get_or_create("a", factory)
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_failed_build(self):
+        cache = LRUCache()
+        with self.assertRaises(ValueError):
+            cache.get_or_create("a", lambda: int("x"))
+        self.assertEqual(cache.get_or_create("a", lambda: 1), 1)
+        self.assertEqual(cache._building, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
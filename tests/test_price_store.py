@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import datetime as dt
+
+from pvpc_bot.ree import price_store
+from pvpc_bot.ree.price_store import PriceColumn, PriceStore
+
+
+class PriceColumnTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.column = PriceColumn(self.root, "prices", 8741)
+        self.minutes = list(range(0, 24 * 60, 60))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def rows(self) -> int:
+        return os.path.getsize(self.column.minutes_path) // 2
+
+    def test_rewritten_day_is_compacted(self):
+        day = dt.date(2022, 1, 31)
+        for other in range(4):
+            self.column.write(day - dt.timedelta(days=other + 1), self.minutes, [0.1] * 24)
+        with mock.patch.object(price_store, "PRICE_STORE_MIN_DEAD_ROWS", 48):
+            for version in range(20):
+                self.column.write(day, self.minutes, [version / 100] * 24)
+                self.assertLessEqual(self.rows(), 5 * 24 / (1 - price_store.PRICE_STORE_MAX_DEAD_RATIO) + 24)
+        minutes, values = self.column.read(day)
+        self.assertEqual(list(minutes), self.minutes)
+        self.assertEqual(list(values), [0.19] * 24)
+        self.assertEqual(list(self.column.read(day - dt.timedelta(days=1))[1]), [0.1] * 24)
+
+    def test_views_keep_their_version(self):
+        day = dt.date(2022, 1, 31)
+        self.column.write(day, self.minutes, [0.1] * 24)
+        _, values = self.column.read(day)
+        for version in range(5):
+            self.column.write(day, self.minutes, [0.2] * 24)
+        self.assertEqual(list(values), [0.1] * 24)
+
+    def test_interrupted_write(self):
+        day = dt.date(2022, 1, 31)
+        self.column.write(day, self.minutes, [0.1] * 24)
+        # Only the minutes of the next day made it to disk
+        with open(self.column.minutes_path, "ab") as f:
+            f.write(b"\x00\x00" * 24)
+        self.column.write(day + dt.timedelta(days=1), self.minutes, [0.2] * 24)
+        minutes, values = self.column.read(day + dt.timedelta(days=1))
+        self.assertEqual(list(minutes), self.minutes)
+        self.assertEqual(list(values), [0.2] * 24)
+        self.assertEqual(os.path.getsize(self.column.values_path) // 8, self.rows())
+
+
+class PriceStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = PriceStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def round_trip(self, datetimes: list) -> list:
+        date = dt.datetime.strptime(datetimes[0][:10], "%Y-%m-%d")
+        values = [{"value": i, "datetime": datetime, "geo_id": 8741, "geo_name": "Península"} for i, datetime in enumerate(datetimes)]
+        self.store.put_document({"indicator": {"geos": [{"geo_id": 8741, "geo_name": "Península"}], "values": values}}, "prices", date)
+        return [value["datetime"] for value in self.store.get_document("prices", date)["indicator"]["values"]]
+
+    def test_document_offsets(self):
+        # Winter, summer and both DST changes keep the datetimes of the API
+        days = [
+            [f"2022-01-31T{hour:02d}:00:00.000+01:00" for hour in range(24)],
+            [f"2022-07-31T{hour:02d}:00:00.000+02:00" for hour in range(24)],
+            [f"2022-03-27T{hour:02d}:00:00.000+01:00" for hour in range(2)] + [f"2022-03-27T{hour:02d}:00:00.000+02:00" for hour in range(3, 24)],
+            [f"2022-10-30T{hour:02d}:00:00.000+02:00" for hour in range(3)] + [f"2022-10-30T{hour:02d}:00:00.000+01:00" for hour in range(2, 24)]
+        ]
+        for datetimes in days:
+            self.assertEqual(self.round_trip(datetimes), datetimes)
+        self.assertEqual(len(set(days[3])), 25)
+
+
+if __name__ == "__main__":
+    unittest.main()
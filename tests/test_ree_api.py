@@ -0,0 +1,97 @@
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import datetime as dt
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from pvpc_bot.ree import ree_api, price_store
+from pvpc_bot.ree.ree_api import ReeCache, DataNotPublished
+
+
+class FakeEsios(BaseHTTPRequestHandler):
+    # Hourly values for every day of the requested window up to the last published one
+    published_until = dt.datetime(2022, 12, 31)
+    requests = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        start = dt.datetime.strptime(query["start_date"][0], "%Y-%m-%dT%H:%M:%S")
+        end = dt.datetime.strptime(query["end_date"][0], "%Y-%m-%dT%H:%M:%S")
+        self.requests.append((urlparse(self.path).path, start, end))
+        values = []
+        date = start
+        while date <= min(end, self.published_until):
+            values.extend(
+                {"value": 1 + hour, "datetime": f"{date:%Y-%m-%d}T{hour:02d}:00:00.000+01:00", "geo_id": 8741, "geo_name": "Península"}
+                for hour in range(24)
+            )
+            date += dt.timedelta(days=1)
+        body = json.dumps({"indicator": {"geos": [{"geo_id": 8741, "geo_name": "Península"}], "values": values}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ReeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.previous = (price_store._price_store, ree_api.CACHE_DIR)
+        price_store._price_store = price_store.PriceStore(self.tmp_dir)
+        ree_api.CACHE_DIR = self.tmp_dir
+        ReeCache.unpublished.clear()
+        FakeEsios.requests = []
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeEsios)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.cache = ReeCache("token", base_url=f"http://127.0.0.1:{self.httpd.server_address[1]}")
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        price_store._price_store, ree_api.CACHE_DIR = self.previous
+        ReeCache.unpublished.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_backfill_chunks(self):
+        # 59 days in chunks of 31: two requests per method
+        start, end = dt.datetime(2022, 1, 1), dt.datetime(2022, 2, 28)
+        self.assertEqual(self.cache.backfill(start, end, chunk_days=31), {"prices": 59, "sections": 59})
+        self.assertEqual(len(FakeEsios.requests), 4)
+        self.assertEqual(len(self.cache.get_range("prices", start, 59)), 59)
+
+        # Stored days are never requested again
+        FakeEsios.requests = []
+        self.assertEqual(self.cache.backfill(start, end, chunk_days=31), {"prices": 59, "sections": 59})
+        self.assertEqual(FakeEsios.requests, [])
+
+        # Extending the range only asks for the new days
+        self.assertEqual(self.cache.backfill(start, dt.datetime(2022, 3, 31), chunk_days=31), {"prices": 90, "sections": 90})
+        self.assertEqual(len(FakeEsios.requests), 4)
+        self.assertTrue(all(request_start >= dt.datetime(2022, 3, 1) for _, request_start, _ in FakeEsios.requests))
+
+    def test_unpublished_ttl(self):
+        # A future day nobody polls for: one request per TTL window, however many times it is asked for
+        date = dt.datetime.combine(dt.date.today() + dt.timedelta(days=5), dt.time())
+        FakeEsios.published_until = date - dt.timedelta(days=1)
+        self.addCleanup(setattr, FakeEsios, "published_until", dt.datetime(2022, 12, 31))
+        with mock.patch.object(ree_api, "UNPUBLISHED_MAX_TTL", 0.5):
+            for window in range(1, 3):
+                for _ in range(5):
+                    with self.assertRaises(DataNotPublished):
+                        self.cache.get_data("prices", date)
+                self.assertEqual(len(FakeEsios.requests), window)
+                time.sleep(0.6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import datetime as dt
+
+from pvpc_bot.ree import price_store
+from pvpc_bot.ree.rollups import RollupStore
+from pvpc_bot.ree.summary import percentile_index
+from pvpc_bot.config import LOW_PERCENTILE, HIGH_PERCENTILE
+
+START = dt.date(2022, 1, 1)
+GEOS = [{"geo_id": 8741, "geo_name": "Península"}]
+
+
+def document(date: 'dt.date', value: 'Callable[[int], float]') -> dict:
+    values = [
+        {"value": value(hour), "datetime": f"{date:%Y-%m-%d}T{hour:02d}:00:00.000+01:00", "geo_id": 8741, "geo_name": "Península"}
+        for hour in range(24)
+    ]
+    return {"indicator": {"geos": GEOS, "values": values}}
+
+
+def section(hour: int) -> int:
+    # Valle from 00h to 08h, punta from 18h
+    return 3 if hour < 8 else 2 if hour < 18 else 1
+
+
+class RollupStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.previous = price_store._price_store
+        store = price_store._price_store = price_store.PriceStore(os.path.join(self.tmp_dir, "store"))
+        # Ten days, the price of hour h of day d is 100 * (d + 1) + h €/MWh
+        for day in range(10):
+            date = START + dt.timedelta(days=day)
+            store.put_document(document(date, lambda hour: 100 * (day + 1) + hour), "prices", date)
+            store.put_document(document(date, section), "sections", date)
+        self.rollups = RollupStore(os.path.join(self.tmp_dir, "rollups.db"))
+
+    def tearDown(self):
+        self.rollups._connection.close()
+        price_store._price_store = self.previous
+        shutil.rmtree(self.tmp_dir)
+
+    def test_catch_up(self):
+        end = START + dt.timedelta(days=9)
+        self.assertEqual(self.rollups.catch_up("Península", START, end), 10)
+        self.assertEqual(self.rollups.catch_up("Península", START, end), 0)
+        self.assertEqual(self.rollups.catch_up("Península", end, end + dt.timedelta(days=5)), 0)
+        self.assertEqual(self.rollups.catch_up("Canarias", START, end), 0)
+
+    def test_stats(self):
+        stats = self.rollups.get_stats("Península", START, START + dt.timedelta(days=9))
+        self.assertEqual(stats["days"], 10)
+        self.assertAlmostEqual(stats["mean"], 0.5615)
+        self.assertEqual(stats["min"], {"price": 0.1, "datetime": dt.datetime(2022, 1, 1, 0)})
+        self.assertEqual(stats["max"], {"price": 1.023, "datetime": dt.datetime(2022, 1, 10, 23)})
+        self.assertEqual(stats["section_means"], {"high": 0.5705, "mid": 0.5625, "low": 0.5535})
+
+        prices = sorted(100 * (day + 1) + hour for day in range(10) for hour in range(24))
+        self.assertAlmostEqual(stats["low_percentile"], prices[percentile_index(240, LOW_PERCENTILE)] / 1000)
+        self.assertAlmostEqual(stats["high_percentile"], prices[percentile_index(240, HIGH_PERCENTILE)] / 1000)
+
+        self.assertEqual([day for day, _, _, _ in stats["daily"]], [START + dt.timedelta(days=day) for day in range(10)])
+        for day, (_, mean, low, high) in enumerate(stats["daily"]):
+            self.assertAlmostEqual(mean, (100 * (day + 1) + 11.5) / 1000)
+            self.assertAlmostEqual(low, (100 * (day + 1)) / 1000)
+            self.assertAlmostEqual(high, (100 * (day + 1) + 23) / 1000)
+
+    def test_partial_range(self):
+        stats = self.rollups.get_stats("Península", START + dt.timedelta(days=2), START + dt.timedelta(days=4))
+        self.assertEqual(stats["days"], 3)
+        self.assertAlmostEqual(stats["mean"], 0.4115)
+        self.assertIsNone(self.rollups.get_stats("Península", dt.date(2023, 1, 1), dt.date(2023, 1, 31)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import json
+import time
+import threading
+import unittest
+import http.client
+
+from pvpc_bot.bot.webhook import WebhookServer
+
+
+class BlockedBot:
+    threaded = False
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def process_new_updates(self, updates):
+        self.release.wait()
+
+
+class WebhookServerTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = BlockedBot()
+        self.server = WebhookServer(self.bot, host="127.0.0.1", port=0, secret_token="", queue_size=1, workers=1)
+        threading.Thread(target=self.server._worker, daemon=True).start()
+        threading.Thread(target=self.server.httpd.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.bot.release.set()
+        self.server.httpd.shutdown()
+        self.server.httpd.server_close()
+
+    def post(self) -> int:
+        connection = http.client.HTTPConnection(*self.server.httpd.server_address)
+        connection.request("POST", self.server.path, json.dumps({"update_id": 1}), {"Content-Type": "application/json"})
+        status = connection.getresponse().status
+        connection.close()
+        return status
+
+    def test_full_queue_returns_503(self):
+        # The worker blocks in the first update, the second one fills the queue
+        self.assertEqual(self.post(), 200)
+        while self.server.updates.qsize():
+            time.sleep(0.01)
+        self.assertEqual(self.post(), 200)
+        self.assertEqual(self.post(), 503)
+        self.assertEqual(self.server.get_stats()["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()